@@ -1,6 +1,14 @@
 from backtesting.lw_breakout_btest import LWBreakout
 
-# Set start fresh to True if you want to download new data
-lw_breakout = LWBreakout(300, start_fresh=False)
-lw_breakout.download_data()
-lw_breakout.populate_results()
+if __name__ == "__main__":
+    # Set start fresh to True if you want to download new data
+    lw_breakout = LWBreakout(300, start_fresh=False)
+    lw_breakout.download_data()
+    lw_breakout.populate_results()
+
+    # Years of minute bars don't fit in memory, stream them a few sessions at a time instead
+    # lw_breakout.download_data(Timeframe.MIN_1, "2019-01-02", "2021-09-30")
+    # lw_breakout.stream("2019-01-02", "2021-09-30", Timeframe.MIN_1)
+
+    # Sweep the strategy parameters, add train_days and test_days for a walk-forward run
+    # lw_breakout.sweep({"moved_days": [2, 3, 5], "min_yesterdays_change": [4, 6, 8]}, train_days=120, test_days=20)
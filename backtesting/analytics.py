@@ -0,0 +1,147 @@
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Tuple
+
+import numpy
+import pandas
+
+from backtesting.lw_engine import BacktestResult
+
+TRADING_DAYS = 252
+ATTRIBUTION_ROWS = 10  # best and worst symbols kept in the report file
+
+
+def daily_returns(daily_pnl: numpy.ndarray, initial_equity: float) -> numpy.ndarray:
+    """ Returns of each day on the equity at its open """
+    equity = initial_equity + numpy.cumsum(daily_pnl)
+    return daily_pnl / numpy.concatenate([[initial_equity], equity[:-1]])
+
+
+def max_drawdown(equity: numpy.ndarray, initial_equity: float) -> Tuple[float, float]:
+    """ Largest fall from a previous peak, in dollars and as a fraction of the peak (both <= 0) """
+    peak = numpy.maximum.accumulate(numpy.concatenate([[initial_equity], equity]))[1:]
+    drawdown = equity - peak
+    if len(drawdown) == 0:
+        return 0.0, 0.0
+    return float(drawdown.min()), float((drawdown / peak).min())
+
+
+def summary(daily_pnl: numpy.ndarray, trade_pnl: numpy.ndarray, notional: numpy.ndarray,
+            initial_equity: float) -> Dict[str, float]:
+    """
+        Performance of a run from its daily P/L and the P/L and traded notional (entry and exit) of its trades.
+        Sharpe and Sortino are annualized from the daily returns, turnover is the average daily traded notional over
+        the average equity.
+    """
+    equity = initial_equity + numpy.cumsum(daily_pnl)
+    returns = daily_returns(daily_pnl, initial_equity)
+    drawdown, drawdown_pct = max_drawdown(equity, initial_equity)
+    wins, losses = trade_pnl[trade_pnl > 0], trade_pnl[trade_pnl < 0]
+
+    if len(losses):
+        profit_factor = float(wins.sum() / -losses.sum())
+    else:
+        # no losing trade: unbounded when something was won, undefined without any trade
+        profit_factor = float("inf") if len(wins) else float("nan")
+
+    std = returns.std(ddof=1) if len(returns) > 1 else 0.0
+    downside = numpy.sqrt(numpy.mean(numpy.minimum(returns, 0) ** 2)) if len(returns) else 0.0
+    annualize = numpy.sqrt(TRADING_DAYS)
+    return {
+        "pnl": float(daily_pnl.sum()),
+        "return": float(equity[-1] / initial_equity - 1) if len(equity) else 0.0,
+        "days": len(daily_pnl),
+        "trades": len(trade_pnl),
+        "win_rate": len(wins) / len(trade_pnl) if len(trade_pnl) else 0.0,
+        "avg_win": float(wins.mean()) if len(wins) else 0.0,
+        "avg_loss": float(losses.mean()) if len(losses) else 0.0,
+        "profit_factor": profit_factor,
+        "sharpe": float(returns.mean() / std * annualize) if std > 0 else 0.0,
+        "sortino": float(returns.mean() / downside * annualize) if downside > 0 else 0.0,
+        "max_drawdown": drawdown,
+        "max_drawdown_pct": drawdown_pct,
+        "turnover": float(notional.sum() / len(equity) / equity.mean()) if len(equity) else 0.0,
+    }
+
+
+def attribution(symbols: numpy.ndarray, trade_pnl: numpy.ndarray, notional: numpy.ndarray) -> pandas.DataFrame:
+    """ P/L, share of the total P/L, trades, win rate and traded notional per symbol, best contributor first """
+    codes, uniques = pandas.factorize(symbols, sort=True)
+    pnl = numpy.bincount(codes, weights=trade_pnl, minlength=len(uniques))
+    trades = numpy.bincount(codes, minlength=len(uniques))
+    wins = numpy.bincount(codes, weights=trade_pnl > 0, minlength=len(uniques))
+    total = trade_pnl.sum()
+    by_symbol = pandas.DataFrame({
+        "pnl": pnl,
+        "contribution": pnl / total if total else numpy.zeros(len(uniques)),
+        "trades": trades,
+        "win_rate": wins / numpy.maximum(trades, 1),
+        "notional": numpy.bincount(codes, weights=notional, minlength=len(uniques)),
+    }, index=pandas.Index(uniques, name="symbol"))
+    return by_symbol.sort_values("pnl", ascending=False, kind="stable")
+
+
+def trade_arrays(trades: pandas.DataFrame) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """ P/L and traded notional (entry and exit) of each trade of a trade log """
+    notional = trades["qty"].to_numpy(dtype=float) * (trades["entry"].to_numpy() + trades["exit"].to_numpy())
+    return trades["pnl"].to_numpy(dtype=float), notional
+
+
+def initial_equity(daily_pnl: numpy.ndarray, equity: numpy.ndarray) -> float:
+    return float(equity[0] - daily_pnl[0]) if len(daily_pnl) else 0.0
+
+
+def summarize(result: BacktestResult) -> Dict[str, float]:
+    """ Summary of a backtest result, without the attribution, e.g. to score each configuration of a sweep """
+    daily_pnl = result.pnl.to_numpy().sum(axis=1)
+    return summary(daily_pnl, *trade_arrays(result.trades), initial_equity(daily_pnl, result.equity.to_numpy()))
+
+
+@dataclass
+class PerformanceReport:
+    summary: Dict[str, float]
+    attribution: pandas.DataFrame
+
+    @classmethod
+    def from_result(cls, result: BacktestResult) -> "PerformanceReport":
+        daily_pnl = result.pnl.to_numpy().sum(axis=1)
+        return cls.from_trades(daily_pnl, result.trades, initial_equity(daily_pnl, result.equity.to_numpy()))
+
+    @classmethod
+    def from_files(cls, folder: Path) -> "PerformanceReport":
+        """ Report of a streamed backtest from the equity.csv and trades.csv it wrote """
+        equity = pandas.read_csv(folder / "equity.csv")
+        daily_pnl = equity["pnl"].to_numpy()
+        return cls.from_trades(daily_pnl, pandas.read_csv(folder / "trades.csv", converters={"symbol": str}),
+                               initial_equity(daily_pnl, equity["equity"].to_numpy()))
+
+    @classmethod
+    def from_trades(cls, daily_pnl: numpy.ndarray, trades: pandas.DataFrame,
+                    starting_equity: float) -> "PerformanceReport":
+        trade_pnl, notional = trade_arrays(trades)
+        return cls(summary(daily_pnl, trade_pnl, notional, starting_equity),
+                   attribution(trades["symbol"].to_numpy(), trade_pnl, notional))
+
+    def to_dict(self) -> Dict:
+        best = self.attribution.head(ATTRIBUTION_ROWS)
+        worst = self.attribution.iloc[::-1].head(ATTRIBUTION_ROWS)
+        return {
+            "summary": self.summary,
+            "symbols": len(self.attribution),
+            "best": json.loads(best.to_json(orient="index")),
+            "worst": json.loads(worst.to_json(orient="index")),
+        }
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print("Report written to {}".format(path))
+
+    def __str__(self):
+        s = self.summary
+        return ("P/L: ${:.2f} ({:.2%}), trades: {}, win rate: {:.1%}, avg win/loss: ${:.2f}/${:.2f}, sharpe: {:.2f}, "
+                "sortino: {:.2f}, max drawdown: ${:.2f} ({:.2%}), turnover: {:.2f}").format(
+            s["pnl"], s["return"], s["trades"], s["win_rate"], s["avg_win"], s["avg_loss"], s["sharpe"],
+            s["sortino"], s["max_drawdown"], s["max_drawdown_pct"], s["turnover"])
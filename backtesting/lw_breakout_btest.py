@@ -1,71 +1,93 @@
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, List, Optional
 
 import pandas as pd
-from alpaca_trade_api.entity import BarSet
 
+from backtesting.analytics import PerformanceReport
+from backtesting.lw_engine import BacktestResult, LWParams, panel_to_arrays, run_backtest
+from backtesting.lw_stream import StreamingBacktest
+from backtesting.sweep import ParameterSweep
 from schedules.watchlist import WatchList
 from strategies.strategy import Strategy
-from utils.broker import AlpacaClient, Timeframe
+from utils.bar_store import TIMEZONE, BarStore
+from utils.bar_sync import BarSync
+from utils.broker import AlpacaClient, Broker, Timeframe
 from utils.notification import NoOpNotification
 from utils.util import load_env_variables
 
 
 class LWBreakout(object):
-    MOVED_DAYS = 3
-    INVESTMENT_PER_STOCK = 1000
-    MIN_PERCENT_CHANGE = -5.0
 
-    def __init__(self, backtest_days: int, start_fresh=False):
+    def __init__(self, backtest_days: int, start_fresh=False, broker: Optional[Broker] = None,
+                 symbols: Optional[List[str]] = None, bar_store: Optional[BarStore] = None):
         LWBreakout._set_pandas_options()
-        load_env_variables()
         self.backtest_days = backtest_days
         self.start_fresh = start_fresh  # fresh download and backtest
-        self.symbols = WatchList().get_universe()
-        self.broker = AlpacaClient(NoOpNotification())
-        self.results = {}
-
-    def download_data(self) -> None:
-
-        for symbol in self.symbols:
-            df_path = Strategy.get_backtest_file_path(symbol)
-            df_path.parent.mkdir(parents=True, exist_ok=True)
-
-            if self.start_fresh or not df_path.exists():
-                print("Downloading data for {} for {} days".format(symbol, self.backtest_days))
-                if self.broker.is_tradable(symbol):
-                    df: BarSet = self.broker.get_bars(symbol, Timeframe.DAY, limit=self.backtest_days)
-                    df.to_pickle(df_path)
-                else:
-                    print("{} is not tradable with broker".format(symbol))
-            else:
-                print("Data already exists for {}".format(symbol))
-
-    def _calculate_profit_per_symbol(self, symbol):
-        df_path = Strategy.get_backtest_file_path(symbol)
-        df = None
-        if df_path.exists():
-            try:
-                df = pd.read_pickle(df_path)
-            except Exception as ex:
-                print("exception occurred while reading pickle file {}: {}".format(df_path.name, ex))
-
-            df['pct_change'] = round(((df['close'] - df['open']) / df['open']) * 100, 2).shift(1).fillna(0.0)
-            df['decision'] = df['pct_change'] < LWBreakout.MIN_PERCENT_CHANGE
-
-            # df['profit_per_share']
-            df.loc[df['decision'], 'profit_per_share'] = df['close'] - df['open']
-            df.loc[not df['decision'], 'profit_per_share'] = 0
-
-            df['profit_amt'] = (LWBreakout.INVESTMENT_PER_STOCK / df['close']) * df['profit_per_share']
-            self.results[symbol] = pd.Series(df['profit_amt'], index=df.index)
-
-    def populate_results(self):
-        for symbol in self.symbols:
-            self._calculate_profit_per_symbol(symbol)
-        final_df = pd.DataFrame(self.results)
-        final_df['profit'] = final_df.sum(axis=1, skipna=True)
-        # print("final DF", final_df)
-        print(final_df['profit'].iloc[-200:].to_json)
+        if broker is None:
+            load_env_variables()
+            broker = AlpacaClient(NoOpNotification())
+        self.broker = broker
+        self.symbols = symbols if symbols is not None else WatchList().get_universe()
+        self.bar_store = bar_store or Strategy.get_bar_store()
+        self.results: Optional[BacktestResult] = None
+
+    def download_data(self, timeframe: Timeframe = Timeframe.DAY, start: Optional[pd.Timestamp] = None,
+                      end: Optional[pd.Timestamp] = None) -> None:
+        # the daily bars of the last `backtest_days`, or all bars between start and end, e.g. the range to `stream`
+        tradable = self.broker.filter_tradable(self.symbols)
+        if len(tradable) < len(self.symbols):
+            print("{} are not tradable with broker".format(sorted(set(self.symbols) - set(tradable))))
+
+        bar_sync = BarSync(self.broker, self.bar_store)
+        if start is None and timeframe == Timeframe.DAY:
+            bar_sync.sync(tradable, timeframe, self.backtest_days, replace=self.start_fresh)
+            return
+
+        # intraday histories are longer than one request, they are paged by date range
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.now(tz=TIMEZONE)
+        start = pd.Timestamp(start) if start is not None else end - pd.offsets.BDay(self.backtest_days)
+        bar_sync.sync_range(tradable, timeframe, start, end, replace=self.start_fresh)
+
+    def populate_results(self, params: Optional[LWParams] = None) -> BacktestResult:
+        self.results = run_backtest(*self._load_arrays(), params)
+
+        report = PerformanceReport.from_result(self.results)
+        print(report)
+        report.write(self._folder(Timeframe.DAY) / "report-{}.json".format(datetime.now().strftime("%Y%m%d-%H%M%S")))
+        return self.results
+
+    def stream(self, start: pd.Timestamp, end: pd.Timestamp, timeframe: Timeframe = Timeframe.MIN_1,
+               params: Optional[LWParams] = None, chunk_days: int = 5,
+               folder: Optional[Path] = None) -> Dict[str, float]:
+        # out-of-core run for long intraday histories, the trades and daily equity are written to `folder`
+        folder = folder or self._folder(timeframe)
+        backtest = StreamingBacktest(self.bar_store, self.symbols, timeframe, params, chunk_days)
+        summary = backtest.run(start, end, folder)
+        if summary["days"] == 0:
+            print("No bars between {} and {}, no report written".format(start, end))
+            return summary
+
+        report = PerformanceReport.from_files(folder)
+        print(report)
+        report.write(folder / "report.json")
+        return summary
+
+    def sweep(self, grid: Dict[str, List], train_days: Optional[int] = None,
+              test_days: Optional[int] = None) -> pd.DataFrame:
+        # e.g. grid = {"moved_days": [2, 3, 5], "min_yesterdays_change": [4, 6, 8]}
+        parameter_sweep = ParameterSweep(*self._load_arrays(), grid)
+        if train_days and test_days:
+            return parameter_sweep.walk_forward(train_days, test_days)
+        return parameter_sweep.run()
+
+    def _load_arrays(self):
+        panel = self.bar_store.tail(self.symbols, Timeframe.DAY, self.backtest_days)
+        return panel_to_arrays(panel)
+
+    @staticmethod
+    def _folder(timeframe: Timeframe) -> Path:
+        return Path(Strategy.DATA) / "backtest" / timeframe.value
 
     @staticmethod
     def _set_pandas_options():
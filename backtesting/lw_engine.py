@@ -0,0 +1,183 @@
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy
+import pandas
+from numpy.lib.stride_tricks import sliding_window_view
+
+from strategies.lw_breakout_strategy import LWBreakout
+from strategies.lw_pick_engine import CLOSE, HIGH, LOW, OPEN, PICK_FIELDS, lw_indicators, window_days
+
+EXIT_REASONS = ["stop", "target", "close"]
+STOP, TARGET, SESSION_CLOSE = range(len(EXIT_REASONS))
+
+
+@dataclass
+class LWParams:
+    """ The live LWBreakout rules, overridable for backtests and parameter sweeps """
+    moved_days: int = LWBreakout.MOVED_DAYS
+    min_price: float = LWBreakout.STOCK_MIN_PRICE
+    max_price: float = LWBreakout.STOCK_MAX_PRICE
+    min_yesterdays_change: float = LWBreakout.MIN_YESTERDAYS_CHANGE
+    amount_per_order: float = LWBreakout.AMOUNT_PER_ORDER
+    max_num_stocks: int = LWBreakout.MAX_NUM_STOCKS
+    stop_loss_steps: float = LWBreakout.STOP_LOSS_STEPS
+    take_profit_steps: float = LWBreakout.TAKE_PROFIT_STEPS
+
+
+@dataclass
+class BacktestResult:
+    trades: pandas.DataFrame  # one row per bracket order
+    pnl: pandas.DataFrame  # realized P/L, days x symbols
+    equity: pandas.Series
+
+
+def panel_to_arrays(panel: pandas.DataFrame) -> Tuple[pandas.Index, pandas.Index, numpy.ndarray]:
+    """
+        Daily (symbol, time) panel as symbols, days and a (symbols, days, 1, open/high/low/close) array, NaN where a
+        symbol has no bar. Daily bars are one-bar sessions to the engine.
+    """
+    fields = [panel[field].unstack(level="time") for field in PICK_FIELDS]
+    symbols, days = fields[0].index, fields[0].columns
+    bars = numpy.stack([field.reindex(index=symbols, columns=days).to_numpy(dtype=float) for field in fields], axis=-1)
+    return symbols, days, bars[:, :, None, :]
+
+
+def daily_bars(bars: numpy.ndarray) -> numpy.ndarray:
+    """ Aggregates (symbols, days, bars per session, OHLC) intraday bars into (symbols, days, OHLC) daily bars """
+    finite = numpy.isfinite(bars[..., CLOSE])
+    first = finite.argmax(axis=2)[..., None]
+    last = (bars.shape[2] - 1 - finite[..., ::-1].argmax(axis=2))[..., None]
+
+    daily = numpy.empty(bars.shape[:2] + (len(PICK_FIELDS),))
+    daily[..., OPEN] = numpy.take_along_axis(bars[..., OPEN], first, axis=2)[..., 0]
+    daily[..., CLOSE] = numpy.take_along_axis(bars[..., CLOSE], last, axis=2)[..., 0]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN sessions
+        daily[..., HIGH] = numpy.nanmax(bars[..., HIGH], axis=2)
+        daily[..., LOW] = numpy.nanmin(bars[..., LOW], axis=2)
+    return daily
+
+
+def compute_signals(daily: numpy.ndarray, params: LWParams) -> Dict[str, numpy.ndarray]:
+    """
+        LW picks of every (symbol, day) as the live strategy computes them before the open: from the daily bars up to
+        the previous session. Arrays are shaped (symbols, days), days without enough history are not eligible.
+    """
+    days = window_days(params.moved_days)
+    windows = numpy.moveaxis(sliding_window_view(daily, days, axis=1), -1, -2)
+
+    signals = {}
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        for name, values in lw_indicators(windows, params.moved_days).items():
+            signal = numpy.full(daily.shape[:2], numpy.nan)
+            signal[:, days:] = values[:, :-1]
+            signals[name] = signal
+
+        price = signals["stock_price"]
+        signals["eligible"] = ((price >= params.min_price) & (price <= params.max_price)
+                               & (signals["yesterdays_change"] > params.min_yesterdays_change))
+    return signals
+
+
+def simulate(signals: Dict[str, numpy.ndarray], bars: numpy.ndarray, params: LWParams) -> Dict[str, numpy.ndarray]:
+    """
+        Resolves the LW entries and their brackets on (symbols, days, bars per session, OHLC) bars.
+
+        A long enters on the first bar trading above lw_upper_bound, a short on the first bar below lw_lower_bound,
+        filled at the bound or at the bar's open when it gaps through. At most max_num_stocks entries are taken per
+        day, earliest first and then by weightage, like the live tick. The bracket is checked from the entry bar
+        on; a bar touching both legs is resolved as a stop. Positions still open are closed at the session close.
+    """
+    n_symbols, _, n_bars, _ = bars.shape
+    open_, high, low, close = (bars[..., field] for field in (OPEN, HIGH, LOW, CLOSE))
+    upper, lower, step = (signals[name][..., None] for name in ("lw_upper_bound", "lw_lower_bound", "step"))
+    eligible = signals["eligible"][..., None]
+
+    with numpy.errstate(invalid="ignore"):
+        long_at = _first(eligible & (high > upper))
+        short_at = _first(eligible & (low < lower))
+    entry_at = numpy.minimum(long_at, short_at)
+    triggered = entry_at < n_bars
+    side = numpy.where(triggered, numpy.where(long_at <= short_at, 1, -1), 0)
+
+    weightage = numpy.where(triggered, signals["weightage"], -numpy.inf)
+    order = numpy.lexsort((-weightage, entry_at), axis=0)
+    rank = numpy.empty_like(order)
+    numpy.put_along_axis(rank, order, numpy.broadcast_to(numpy.arange(n_symbols)[:, None], order.shape), axis=0)
+    side = numpy.where(rank < params.max_num_stocks, side, 0)
+    taken = side != 0
+
+    entry_open = numpy.take_along_axis(open_, numpy.minimum(entry_at, n_bars - 1)[..., None], axis=2)[..., 0]
+    entry = numpy.where(side > 0, numpy.fmax(entry_open, upper[..., 0]), numpy.fmin(entry_open, lower[..., 0]))
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        qty = numpy.where(taken, numpy.floor(params.amount_per_order / entry), 0)
+    stop = entry - side * params.stop_loss_steps * step[..., 0]
+    target = entry + side * params.take_profit_steps * step[..., 0]
+
+    in_trade = numpy.arange(n_bars) >= entry_at[..., None]
+    is_long = (side > 0)[..., None]
+    with numpy.errstate(invalid="ignore"):
+        stop_at = _first(in_trade & numpy.where(is_long, low <= stop[..., None], high >= stop[..., None]))
+        target_at = _first(in_trade & numpy.where(is_long, high >= target[..., None], low <= target[..., None]))
+
+    session_close = daily_bars(bars)[..., CLOSE]
+    reason = numpy.where(stop_at < n_bars, numpy.where(stop_at <= target_at, STOP, TARGET),
+                         numpy.where(target_at < n_bars, TARGET, SESSION_CLOSE))
+    exit_price = numpy.choose(reason, [stop, target, session_close])
+    exit_at = numpy.choose(reason, [stop_at, target_at, numpy.full_like(stop_at, n_bars - 1)])
+
+    return {
+        "side": side,
+        "qty": qty,
+        "entry": entry,
+        "entry_at": entry_at,
+        "exit": exit_price,
+        "exit_at": exit_at,
+        "reason": reason,
+        "pnl": numpy.where(taken, side * (exit_price - entry) * qty, 0.0),
+    }
+
+
+def trade_log(symbols: pandas.Index, days: pandas.Index, signals: Dict[str, numpy.ndarray],
+              fills: Dict[str, numpy.ndarray]) -> pandas.DataFrame:
+    s, d = numpy.nonzero(fills["side"])
+    trades = pandas.DataFrame({
+        "date": days[d],
+        "symbol": symbols[s],
+        "side": numpy.where(fills["side"][s, d] > 0, "buy", "sell"),
+        "qty": fills["qty"][s, d].astype(int),
+        "weightage": signals["weightage"][s, d],
+        "step": signals["step"][s, d],
+        "entry_at": fills["entry_at"][s, d],
+        "entry": fills["entry"][s, d],
+        "exit_at": fills["exit_at"][s, d],
+        "exit": fills["exit"][s, d],
+        "reason": numpy.asarray(EXIT_REASONS)[fills["reason"][s, d]],
+        "pnl": fills["pnl"][s, d],
+    })
+    return trades.sort_values(["date", "entry_at", "weightage"], ascending=[True, True, False], ignore_index=True)
+
+
+def run_backtest(symbols: pandas.Index, days: pandas.Index, bars: numpy.ndarray, params: Optional[LWParams] = None,
+                 initial_equity: float = 100000, verbose: bool = True) -> BacktestResult:
+    """ Runs the LW breakout rules over (symbols, days, bars per session, OHLC) bars """
+    params = params or LWParams()
+    start = time.perf_counter()
+    signals = compute_signals(daily_bars(bars), params)
+    fills = simulate(signals, bars, params)
+
+    pnl = pandas.DataFrame(fills["pnl"].T, index=days, columns=symbols)
+    equity = initial_equity + pnl.sum(axis=1).cumsum()
+    trades = trade_log(symbols, days, signals, fills)
+    if verbose:
+        print("Backtested {} symbols x {} days: {} trades in {:.2f}s".format(len(symbols), len(days), len(trades),
+                                                                            time.perf_counter() - start))
+    return BacktestResult(trades, pnl, equity)
+
+
+def _first(mask: numpy.ndarray) -> numpy.ndarray:
+    # index of the first True along the last axis, its length when there is none
+    return numpy.where(mask.any(axis=-1), mask.argmax(axis=-1), mask.shape[-1])
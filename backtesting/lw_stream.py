@@ -0,0 +1,131 @@
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy
+import pandas
+
+from backtesting.lw_engine import BacktestResult, LWParams, compute_signals, daily_bars, simulate, trade_log
+from strategies.lw_pick_engine import PICK_FIELDS, window_days
+from utils.bar_store import TIMEZONE, BarStore
+from utils.bar_sync import BAR_DURATION
+from utils.broker import Timeframe
+
+SESSION_OPEN = pandas.Timedelta(hours=9, minutes=30)
+SESSION_LENGTH = pandas.Timedelta(hours=6, minutes=30)
+
+
+def bars_per_session(timeframe: Timeframe) -> int:
+    return 1 if timeframe == Timeframe.DAY else SESSION_LENGTH // BAR_DURATION[timeframe]
+
+
+def session_chunks(bar_store: BarStore, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                   end: pandas.Timestamp, chunk_days: int = 5) -> Iterator[Tuple[pandas.DatetimeIndex, numpy.ndarray]]:
+    """
+        Sessions between start and end, `chunk_days` business days at a time, as days and (symbols, days, bars per
+        session, OHLC) arrays, NaN where a symbol has no bar. Only the slices of the memory-mapped bars of a chunk are
+        read, bars outside the regular session are dropped and days no symbol traded (holidays) are skipped.
+    """
+    n_bars = bars_per_session(timeframe)
+    duration = BAR_DURATION[timeframe].value if timeframe != Timeframe.DAY else 1
+    first_day = numpy.datetime64(pandas.Timestamp(start).date(), "D")
+    last_day = numpy.datetime64(pandas.Timestamp(end).date(), "D")
+
+    chunk_start = numpy.busday_offset(first_day, 0, roll="forward")
+    while chunk_start <= last_day:
+        chunk_end = min(numpy.busday_offset(chunk_start, chunk_days, roll="forward"), last_day + 1)
+        first = pandas.Timestamp(chunk_start, tz=TIMEZONE)
+        last = pandas.Timestamp(chunk_end, tz=TIMEZONE) - pandas.Timedelta(1)
+        chunk_start = chunk_end
+        # copied out so that the mapping of each file is released before the next one is read
+        slices = [bar_store.read_range(symbol, timeframe, first, last).copy() for symbol in symbols]
+
+        rows = numpy.repeat(numpy.arange(len(symbols)), [len(bars) for bars in slices])
+        if len(rows) == 0:
+            continue
+        bars = numpy.concatenate(slices)
+        local = pandas.DatetimeIndex(pandas.to_datetime(bars["time"], utc=True)).tz_convert(TIMEZONE)
+        session_days = local.normalize()
+        if timeframe == Timeframe.DAY:
+            slots = numpy.zeros(len(bars), dtype=int)
+        else:
+            slots = ((local - session_days) - SESSION_OPEN).asi8 // duration
+        in_session = (slots >= 0) & (slots < n_bars)
+
+        days = session_days[in_session].unique().sort_values()
+        array = numpy.full((len(symbols), len(days), n_bars, len(PICK_FIELDS)), numpy.nan)
+        columns = numpy.searchsorted(days, session_days[in_session])
+        for i, field in enumerate(PICK_FIELDS):
+            array[rows[in_session], columns, slots[in_session], i] = bars[field][in_session]
+        yield days, array
+
+
+class StreamingBacktest(object):
+    """
+        LW breakout backtest over histories that don't fit in memory, e.g. years of minute bars of the universe. The
+        sessions are streamed chunk by chunk from the bar store, each chunk is run by the vectorized engine and its
+        results are appended to the output files, so memory is bounded by one chunk whatever the length of the
+        history. The daily bars of the lookback window and the equity are carried from one chunk to the next; LW
+        positions are closed at the session close, so no position is open between chunks.
+    """
+
+    def __init__(self, bar_store: BarStore, symbols: List[str], timeframe: Timeframe = Timeframe.MIN_1,
+                 params: Optional[LWParams] = None, chunk_days: int = 5, initial_equity: float = 100000):
+        self.bar_store = bar_store
+        self.symbols = pandas.Index(symbols)
+        self.timeframe = timeframe
+        self.params = params or LWParams()
+        self.chunk_days = chunk_days
+        self.initial_equity = initial_equity
+
+    def chunks(self, start: pandas.Timestamp, end: pandas.Timestamp) -> Iterator[BacktestResult]:
+        """ Results of the sessions between start and end, one chunk at a time """
+        lookback_days = window_days(self.params.moved_days)
+        lookback = numpy.full((len(self.symbols), lookback_days, len(PICK_FIELDS)), numpy.nan)
+        equity = self.initial_equity
+        sessions = 0
+
+        for days, bars in session_chunks(self.bar_store, list(self.symbols), self.timeframe, start, end,
+                                         self.chunk_days):
+            daily = numpy.concatenate([lookback, daily_bars(bars)], axis=1)
+            signals = {name: signal[:, lookback_days:]
+                       for name, signal in compute_signals(daily, self.params).items()}
+            # the first sessions have no full lookback window, as in the in-memory backtest
+            signals["eligible"][:, :max(0, lookback_days - sessions)] = False
+            sessions += len(days)
+            fills = simulate(signals, bars, self.params)
+            lookback = daily[:, -lookback_days:]
+
+            pnl = pandas.DataFrame(fills["pnl"].T, index=days, columns=self.symbols)
+            chunk_equity = equity + pnl.sum(axis=1).cumsum()
+            equity = float(chunk_equity.iloc[-1])
+            yield BacktestResult(trade_log(self.symbols, days, signals, fills), pnl, chunk_equity)
+
+    def run(self, start: pandas.Timestamp, end: pandas.Timestamp, folder: Path) -> Dict[str, float]:
+        """ Writes trades.csv and equity.csv (daily P/L, equity and trades) to `folder` as the chunks complete """
+        folder.mkdir(parents=True, exist_ok=True)
+        trades_path, equity_path = folder / "trades.csv", folder / "equity.csv"
+        for path in (trades_path, equity_path):
+            path.unlink(missing_ok=True)
+
+        started = time.perf_counter()
+        summary = {"days": 0, "trades": 0, "pnl": 0.0, "equity": self.initial_equity}
+        for result in self.chunks(start, end):
+            daily = pandas.DataFrame({"pnl": result.pnl.sum(axis=1), "equity": result.equity,
+                                      "trades": result.trades.groupby("date").size()}).fillna({"trades": 0})
+            daily.index.name = "date"
+            first = summary["days"] == 0
+            result.trades.to_csv(trades_path, mode="a", header=first, index=False)
+            daily.astype({"trades": int}).to_csv(equity_path, mode="a", header=first)
+
+            summary["days"] += len(daily)
+            summary["trades"] += len(result.trades)
+            summary["pnl"] += float(daily["pnl"].sum())
+            summary["equity"] = float(result.equity.iloc[-1])
+            print("Backtested up to {}: {} trades, equity ${:.2f}".format(daily.index[-1].date(), summary["trades"],
+                                                                          summary["equity"]))
+
+        print("Backtested {} symbols x {} days: {} trades, P/L ${:.2f} in {:.2f}s, results in {}".format(
+            len(self.symbols), summary["days"], summary["trades"], summary["pnl"], time.perf_counter() - started,
+            folder))
+        return summary
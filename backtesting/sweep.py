@@ -0,0 +1,137 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, fields
+from datetime import datetime
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+
+from backtesting.analytics import summarize
+from backtesting.lw_engine import BacktestResult, LWParams, run_backtest
+from strategies.lw_pick_engine import window_days
+
+METRICS = ["pnl", "trades", "win_rate", "avg_win", "avg_loss", "sharpe", "sortino", "max_drawdown", "turnover"]
+
+# bars shared by the worker processes, attached once per worker
+_shared_memory: Optional[SharedMemory] = None
+_symbols: Optional[pandas.Index] = None
+_days: Optional[pandas.Index] = None
+_bars: Optional[numpy.ndarray] = None
+
+
+def parameter_grid(grid: Dict[str, List]) -> List[LWParams]:
+    """ Every combination of the grid, e.g. {"moved_days": [2, 3], "max_num_stocks": [20, 40]} """
+    names = list(grid)
+    unknown = set(names) - {field.name for field in fields(LWParams)}
+    if unknown:
+        raise ValueError("Unknown LWParams: {}".format(sorted(unknown)))
+    return [LWParams(**dict(zip(names, values))) for values in itertools.product(*grid.values())]
+
+
+def walk_forward_splits(n_days: int, train_days: int, test_days: int) -> List[Tuple[range, range]]:
+    """ Consecutive (train, test) day ranges, each test window directly following its train window """
+    splits = []
+    for start in range(0, n_days - train_days - test_days + 1, test_days):
+        splits.append((range(start, start + train_days), range(start + train_days, start + train_days + test_days)))
+    return splits
+
+
+def score(result: BacktestResult) -> Dict[str, float]:
+    summary = summarize(result)
+    return {metric: summary[metric] for metric in METRICS}
+
+
+class ParameterSweep(object):
+    """
+        Evaluates a grid of LWParams on a process pool. The bars are copied once into shared memory and every worker
+        maps the same buffer, so only parameters and scores cross process boundaries.
+    """
+    FOLDER = Path("/".join(["data", "sweeps"]))
+
+    def __init__(self, symbols: pandas.Index, days: pandas.Index, bars: numpy.ndarray, grid: Dict[str, List],
+                 rank_by: str = "sharpe", workers: Optional[int] = None):
+        self.symbols = symbols
+        self.days = days
+        self.bars = bars
+        self.params = parameter_grid(grid)
+        self.rank_by = rank_by
+        self.workers = workers or os.cpu_count()
+
+    def run(self) -> pandas.DataFrame:
+        """ Ranks every parameter combination over all days """
+        tasks = [(params, 0, len(self.days)) for params in self.params]
+        results = self._rank(self._evaluate(tasks))
+        self._write(results, "sweep")
+        return results
+
+    def walk_forward(self, train_days: int, test_days: int) -> pandas.DataFrame:
+        """ Picks the best parameters on each train window and scores them out of sample on the next test window """
+        splits = walk_forward_splits(len(self.days), train_days, test_days)
+        tasks = [(params, train.start, train.stop) for train, _ in splits for params in self.params]
+        train_results = self._evaluate(tasks)
+
+        best = []
+        for split, (train, test) in enumerate(splits):
+            in_sample = self._rank(train_results[split * len(self.params):(split + 1) * len(self.params)])
+            best.append(in_sample.iloc[0])
+        test_results = self._evaluate([(self._to_params(row), test.start, test.stop)
+                                       for row, (_, test) in zip(best, splits)])
+
+        results = pandas.concat([pandas.DataFrame(best).add_prefix("train_").reset_index(drop=True),
+                                 test_results[METRICS].add_prefix("test_")], axis=1)
+        results.insert(0, "split", range(len(splits)))
+        results.insert(1, "test_from", [self.days[test.start] for _, test in splits])
+        self._write(results, "walk-forward")
+        return results
+
+    def _evaluate(self, tasks: List[Tuple[LWParams, int, int]]) -> pandas.DataFrame:
+        start = time.perf_counter()
+        shared_memory = SharedMemory(create=True, size=self.bars.nbytes)
+        try:
+            numpy.ndarray(self.bars.shape, self.bars.dtype, buffer=shared_memory.buf)[:] = self.bars
+            initargs = (shared_memory.name, self.bars.shape, self.bars.dtype.str, self.symbols, self.days)
+            with ProcessPoolExecutor(self.workers, initializer=_attach, initargs=initargs) as pool:
+                scores = list(pool.map(_evaluate, tasks, chunksize=max(1, len(tasks) // (self.workers * 4))))
+        finally:
+            shared_memory.close()
+            shared_memory.unlink()
+
+        print("Evaluated {} backtests on {} workers in {:.2f}s".format(len(tasks), self.workers,
+                                                                       time.perf_counter() - start))
+        return pandas.DataFrame([{**asdict(params), **result} for (params, _, _), result in zip(tasks, scores)])
+
+    def _rank(self, results: pandas.DataFrame) -> pandas.DataFrame:
+        return results.sort_values(self.rank_by, ascending=False, kind="stable", ignore_index=True)
+
+    @staticmethod
+    def _to_params(row: pandas.Series) -> LWParams:
+        return LWParams(**{field.name: field.type(row[field.name]) for field in fields(LWParams)})
+
+    def _write(self, results: pandas.DataFrame, kind: str) -> None:
+        self.FOLDER.mkdir(parents=True, exist_ok=True)
+        path = self.FOLDER / "{}-{}.csv".format(kind, datetime.now().strftime("%Y%m%d-%H%M%S"))
+        results.to_csv(path, index=False)
+        print("Results written to {}".format(path))
+
+
+def _attach(name: str, shape: Tuple, dtype: str, symbols: pandas.Index, days: pandas.Index) -> None:
+    global _shared_memory, _symbols, _days, _bars
+    _shared_memory = SharedMemory(name=name)
+    _bars = numpy.ndarray(shape, numpy.dtype(dtype), buffer=_shared_memory.buf)
+    _symbols, _days = symbols, days
+
+
+def _evaluate(task: Tuple[LWParams, int, int]) -> Dict[str, float]:
+    params, start, stop = task
+    # the window before `start` only warms up the indicators, its days cannot trade
+    warm_up = min(start, window_days(params.moved_days))
+    result = run_backtest(_symbols, _days[start - warm_up:stop], _bars[:, start - warm_up:stop], params,
+                          verbose=False)
+    result.pnl = result.pnl.iloc[warm_up:]
+    result.equity = result.equity.iloc[warm_up:]
+    return score(result)
@@ -0,0 +1,2 @@
+def bench_populate_results(benchmark, backtest):
+    benchmark.pedantic(backtest.populate_results, rounds=5)
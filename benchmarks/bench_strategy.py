@@ -0,0 +1,28 @@
+import shutil
+
+from utils.broker import Timeframe
+
+
+def bench_todays_picks_cold(benchmark, strategy):
+    # every round downloads the bars of the whole universe into an empty store
+    def empty_store():
+        shutil.rmtree(strategy.market_data.bar_store.folder / Timeframe.DAY.value, ignore_errors=True)
+        strategy.market_data.synced = {}
+
+    benchmark.pedantic(strategy._get_todays_picks, setup=empty_store, rounds=3)
+
+
+def bench_todays_picks_warm(benchmark, strategy):
+    # the bars were synced earlier in the day, e.g. by another strategy
+    strategy._get_todays_picks()
+    benchmark.pedantic(strategy._get_todays_picks, rounds=5)
+
+
+def bench_run(benchmark, strategy, broker):
+    strategy.todays_stock_picks = strategy._get_todays_picks()
+
+    def new_tick():
+        strategy.stocks_traded_today = []
+        broker.reset_orders()
+
+    benchmark.pedantic(strategy.run, setup=new_tick, rounds=10)
@@ -0,0 +1,60 @@
+import shutil
+from typing import List, Optional
+
+import pytest
+
+from backtesting.lw_breakout_btest import LWBreakout as LWBreakoutBacktest
+from strategies.lw_breakout_strategy import LWBreakout
+from strategies.strategy import Strategy
+from utils.bar_store import BarStore
+from utils.broker import BAR_FIELDS
+from utils.market_data import MarketData
+from utils.state_store import StateStore
+from utils.simulated_broker import SimulatedBroker
+
+SIZES = [100, 1000, 4000]
+HISTORY = 300  # days of synthetic bars, the backtest window
+LATENCY = 0.001  # seconds per simulated broker call
+
+
+class SimulatedWatchList(object):
+    """ The simulated broker's symbols, priced by their last close """
+
+    def __init__(self, broker: SimulatedBroker):
+        self.symbols = broker.symbols
+        self.lastsale = broker.bars[:, -1, BAR_FIELDS.index("close")]
+
+    def get_universe(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[str]:
+        return [symbol for symbol, price in zip(self.symbols, self.lastsale)
+                if (min_price is None or price >= min_price) and (max_price is None or price <= max_price)]
+
+
+@pytest.fixture(scope="session", params=SIZES, ids=lambda size: "{}-symbols".format(size))
+def broker(request) -> SimulatedBroker:
+    return SimulatedBroker(request.param, history=HISTORY, latency=LATENCY)
+
+
+@pytest.fixture
+def bar_store(tmp_path) -> BarStore:
+    store = BarStore(tmp_path / "bars")
+    yield store
+    shutil.rmtree(tmp_path / "bars", ignore_errors=True)
+
+
+@pytest.fixture
+def strategy(broker, bar_store, tmp_path) -> LWBreakout:
+    # the live strategy, wired to the simulated broker and a throwaway bar and state store, without rate limiting
+    broker.reset_orders()
+    market_data = MarketData(broker, SimulatedWatchList(broker), bar_store, workers=4)
+    strategy = LWBreakout(broker, market_data=market_data)
+    strategy.state = StateStore(tmp_path / "state")
+    return strategy
+
+
+@pytest.fixture
+def backtest(broker, bar_store, tmp_path, monkeypatch) -> LWBreakoutBacktest:
+    # reports go to the throwaway folder too
+    monkeypatch.setattr(Strategy, "DATA", str(tmp_path))
+    backtest = LWBreakoutBacktest(HISTORY, broker=broker, symbols=broker.symbols, bar_store=bar_store)
+    backtest.download_data()
+    return backtest
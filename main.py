@@ -1,48 +1,84 @@
-import time
+import asyncio
 from datetime import datetime
 
-import schedule
 import ulid
 
-from strategies.lw_breakout_strategy import LWBreakout
 from schedules.cleanup import CleanUp
 from schedules.final_steps import FinalSteps
 from schedules.initial_steps import InitialSteps
 from schedules.intermediate import Intermediate
-from schedules.watchlist import WatchList
+from schedules.scheduler import AsyncScheduler
+from strategies.runtime import StrategyRuntime
 from utils.broker import AlpacaClient
-from utils.notification import Pushover
-from utils.util import load_env_variables
+from utils.dry_run_broker import DryRunBroker
+from utils.journal import SqliteJournal
+from utils.market_data import MarketData
+from utils.metrics import Metrics
+from utils.notification import NotificationQueue, Pushover
+from utils.transport import Transport
+from utils.util import load_app_variables, load_env_variables
 
 
 class AppConfig(object):
 
     def __init__(self):
         load_env_variables()
-        self.notification = Pushover()
+        common = load_app_variables("common")
+        self.metrics_file = common.get("metrics_file")
+        self.metrics_pushgateway = common.get("metrics_pushgateway")
+        self.run_id = self.generate_run_id()
+        self.journal = SqliteJournal(common["db_name"], self.run_id)
+        self.notification = NotificationQueue(Pushover())
         self.broker = AlpacaClient(self.notification)
-        self.watchlist = WatchList()
+        if common["dry_run"]:
+            # Alpaca still serves the market data, orders are filled locally
+            self.broker = DryRunBroker(self.broker, common.get("dry_run_equity", 100000))
+        self.broker.sync_portfolio().add_fill_handler(self.journal.record_fill)
+        self.market_data = MarketData.from_config(self.broker)
         self.initial_steps = InitialSteps(self.broker, self.notification)
         self.intermediate = Intermediate(self.broker)
-        self.strategy = LWBreakout(self.broker)
+        self.runtime = StrategyRuntime(self.broker, common.get("strategies", ["LWBreakout"]), self.market_data,
+                                       self.journal)
+        self.journal.start_run(",".join(self.runtime.get_algo_names()), common["dry_run"])
         self.cleanup = CleanUp(self.broker)
         self.final_steps = FinalSteps(self.broker, self.notification)
 
     def run_initial_steps(self):
         self.initial_steps.show_portfolio_details()
-        return self.strategy.initialize()
+        return self.runtime.initialize()
+
+    def resume(self):
+        self.runtime.resume()
 
     def run_strategy(self):
-        self.strategy.run()
+        self.runtime.run()
 
     def show_current_holdings(self):
         return self.intermediate.run_stats()
 
     def run_before_market_close(self):
+        # each strategy closes its own symbols and releases them and its budget, then anything no strategy owns
+        self.runtime.close_all_positions()
         self.cleanup.close_all_positions()
 
     def run_after_market_close(self):
         self.final_steps.show_portfolio_details()
+        print(Transport.shared().report())
+        if isinstance(self.broker, DryRunBroker):
+            print(self.broker.report())
+        self.report_metrics()
+
+    def precompute_picks(self):
+        self.runtime.precompute()
+
+    def report_metrics(self):
+        metrics = Metrics.shared()
+        print(metrics.summary(self.run_id))
+        if self.metrics_file:
+            metrics.write_prometheus(self.metrics_file, self.run_id)
+        if self.metrics_pushgateway:
+            Transport.shared().request("pushgateway", "PUT", "{}/metrics/job/vyapari/run_id/{}".format(
+                self.metrics_pushgateway.rstrip("/"), self.run_id), data=metrics.to_prometheus(self.run_id))
 
     @staticmethod
     def generate_run_id() -> str:
@@ -55,16 +91,25 @@ if __name__ == "__main__":
     start_trading = "06:30"
     stop_trading = "12:30"
     end_time = "13:00"
-
-    # Run this only on weekdays : PST time
-    if datetime.today().weekday() < 5:
-        run_id = app_config.generate_run_id()  # TODO: Add this to Logger
-        schedule.every().day.at(start_trading).do(app_config.run_initial_steps)
-        schedule.every(1).minutes.at(":00").until(stop_trading).do(app_config.run_strategy)
-        schedule.every(5).minutes.at(":00").until(end_time).do(app_config.show_current_holdings)
-        schedule.every().day.at(stop_trading).do(app_config.run_before_market_close)
-        schedule.every().day.at(end_time).do(app_config.run_after_market_close)
-
-    while True:
-        schedule.run_pending()
-        time.sleep(10)  # change this if ny of the above jobs are more frequent
+    precompute_time = "13:30"
+
+    # Run this only on trading days (weekends and market holidays are skipped) : PST time
+    is_trading_day = app_config.broker.is_trading_day
+    print("Run id: {}".format(app_config.run_id))
+    if start_trading < datetime.now().strftime("%H:%M") < stop_trading and is_trading_day():
+        # restarted during the session: resume from the day's snapshots instead of waiting for tomorrow
+        app_config.resume()
+
+    scheduler = AsyncScheduler()
+    scheduler.at(start_trading, app_config.run_initial_steps, timeout=60 * 60, condition=is_trading_day)
+    scheduler.every(1, app_config.run_strategy, timeout=55, until=stop_trading, condition=is_trading_day)
+    scheduler.every(5, app_config.show_current_holdings, timeout=60, until=end_time, condition=is_trading_day)
+    scheduler.at(stop_trading, app_config.run_before_market_close, timeout=15 * 60, condition=is_trading_day)
+    scheduler.at(end_time, app_config.run_after_market_close, timeout=5 * 60, condition=is_trading_day)
+    scheduler.at(precompute_time, app_config.precompute_picks, timeout=60 * 60, condition=is_trading_day)
+
+    try:
+        asyncio.run(scheduler.run())
+    finally:
+        app_config.notification.close()
+        app_config.journal.close()
@@ -0,0 +1,123 @@
+import abc
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timedelta
+from typing import Callable, List, Optional, Set
+
+
+class Job(abc.ABC):
+    """ A job runs on a worker thread, a new run is skipped while the previous one is still running """
+
+    def __init__(self, func: Callable, timeout: float, condition: Optional[Callable[[], bool]] = None):
+        self.func = func
+        self.name = getattr(func, "__name__", repr(func))
+        self.timeout = timeout
+        self.condition = condition
+        self.running = False
+
+    @abc.abstractmethod
+    def next_run(self, now: datetime) -> datetime:
+        pass
+
+
+class DailyJob(Job):
+
+    def __init__(self, at: str, func: Callable, timeout: float, condition: Optional[Callable[[], bool]] = None):
+        super().__init__(func, timeout, condition)
+        self.at = _parse_time(at)
+
+    def next_run(self, now: datetime) -> datetime:
+        run_at = datetime.combine(now.date(), self.at)
+        return run_at if run_at > now else run_at + timedelta(days=1)
+
+
+class IntervalJob(Job):
+    """ Runs on the wall-clock minute boundaries that are multiples of `minutes`, between `start` and `until` """
+
+    def __init__(self, minutes: int, func: Callable, timeout: float, start: Optional[str] = None,
+                 until: Optional[str] = None, condition: Optional[Callable[[], bool]] = None):
+        super().__init__(func, timeout, condition)
+        self.minutes = minutes
+        self.start = _parse_time(start) if start else time.min
+        self.until = _parse_time(until) if until else time.max
+
+    def next_run(self, now: datetime) -> datetime:
+        minute_of_day = now.hour * 60 + now.minute + 1
+        minute_of_day += -minute_of_day % self.minutes
+        run_at = datetime.combine(now.date(), time.min) + timedelta(minutes=minute_of_day)
+
+        run_at = max(run_at, datetime.combine(run_at.date(), self.start))
+        if run_at.time() > self.until:
+            run_at = datetime.combine(run_at.date() + timedelta(days=1), self.start)
+        return run_at
+
+
+class AsyncScheduler(object):
+    """
+        Replaces the `schedule` polling loop: every job is its own asyncio task sleeping until its next wall-clock
+        run, so a slow job never delays the others. Runs are bounded by a per job timeout and skipped while a
+        previous run of the same job is still going.
+    """
+    MAX_SLEEP = 30  # seconds, re-check the wall clock at least this often
+
+    def __init__(self):
+        self.jobs: List[Job] = []
+        self.tasks: Set[asyncio.Task] = set()  # the loop only keeps weak references to running tasks
+
+    def at(self, at: str, func: Callable, timeout: float, condition: Optional[Callable[[], bool]] = None) -> Job:
+        return self._add(DailyJob(at, func, timeout, condition))
+
+    def every(self, minutes: int, func: Callable, timeout: float, start: Optional[str] = None,
+              until: Optional[str] = None, condition: Optional[Callable[[], bool]] = None) -> Job:
+        return self._add(IntervalJob(minutes, func, timeout, start, until, condition))
+
+    async def run(self) -> None:
+        executor = ThreadPoolExecutor(max_workers=len(self.jobs), thread_name_prefix="job")
+        asyncio.get_running_loop().set_default_executor(executor)
+        await asyncio.gather(*[self._schedule(job) for job in self.jobs])
+
+    def _add(self, job: Job) -> Job:
+        self.jobs.append(job)
+        return job
+
+    async def _schedule(self, job: Job) -> None:
+        while True:
+            await self._sleep_until(job.next_run(datetime.now()))
+            task = asyncio.create_task(self._run(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, job: Job) -> None:
+        if job.running:
+            logging.warning("Skipping %s, previous run is still in progress", job.name)
+            return
+
+        job.running = True
+        future = asyncio.get_running_loop().run_in_executor(None, self._call, job)
+        future.add_done_callback(lambda _: setattr(job, "running", False))
+        try:
+            # shielded: a timed out job keeps its thread, and overlapping runs stay blocked until it returns
+            await asyncio.wait_for(asyncio.shield(future), job.timeout)
+        except asyncio.TimeoutError:
+            logging.error("%s did not finish within %ss", job.name, job.timeout)
+        except Exception:
+            logging.exception("%s failed", job.name)
+
+    @staticmethod
+    def _call(job: Job) -> None:
+        # the condition may hit the network, so it is evaluated on the worker thread as well
+        if job.condition is None or job.condition():
+            job.func()
+
+    @staticmethod
+    async def _sleep_until(run_at: datetime) -> None:
+        while True:
+            remaining = (run_at - datetime.now()).total_seconds()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, AsyncScheduler.MAX_SLEEP))
+
+
+def _parse_time(value: str) -> time:
+    return datetime.strptime(value, "%H:%M").time()
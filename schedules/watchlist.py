@@ -1,34 +1,112 @@
+import os
+import threading
 import time
+from pathlib import Path
 from random import randint
-from typing import List
+from typing import List, Optional
 from urllib.parse import urlparse
 
+import pandas
 import requests
-from requests import ConnectTimeout, HTTPError, ReadTimeout, Timeout
+
+from utils.metrics import Metrics
+from utils.transport import Transport
 
 
 class WatchList(object):
+    """
+        NASDAQ screener snapshot (symbol, last sale, market cap, sector) cached on disk for TTL_SECONDS, so that
+        restarts and backtests don't download it again. Universes can be narrowed to a price band before any bars are
+        requested for them.
+    """
     nasdaq = "https://api.nasdaq.com/api/screener/stocks?tableonly=true"
     no_of_stocks = 4000
     stocks_type = ["mega", "large", "mid", "small"]
     recommendation_type = ["strong_buy", "buy"]
 
-    def __init__(self):
+    FOLDER = Path("/".join(["data", "universe"]))
+    TTL_SECONDS = 12 * 60 * 60
+    # the last sale can differ from the close the strategy filters on, keep symbols near the band edges
+    PRICE_BAND_MARGIN = 0.1
+
+    def __init__(self, transport: Transport = None, folder: Path = FOLDER):
+        self.transport = transport or Transport.shared()
+        self.path = folder / "nasdaq.csv"
+        self.lock = threading.Lock()
+        self._screener: Optional[pandas.DataFrame] = None
+        self._loaded_at = 0.0
         self.NASDAQ_API_URL = "&".join([WatchList.nasdaq, "=".join(["limit", str(WatchList.no_of_stocks)]),
                                         "=".join(["marketcap", "|".join(WatchList.stocks_type)]),
                                         "=".join(["recommendation", "|".join(WatchList.recommendation_type)])
                                         ])
 
-    def get_universe(self) -> List[str]:
+    def get_universe(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[str]:
+        """ Screener symbols, only those last sold within [min_price, max_price] (with a margin) when given """
+        screener = self.get_screener()
+        in_band = pandas.Series(True, index=screener.index)
+        if min_price is not None:
+            in_band &= ~(screener["lastsale"] < min_price * (1 - WatchList.PRICE_BAND_MARGIN))
+        if max_price is not None:
+            in_band &= ~(screener["lastsale"] > max_price * (1 + WatchList.PRICE_BAND_MARGIN))
+
+        all_stocks = screener.index[in_band].tolist()
+        Metrics.shared().increment("universe_symbols", len(all_stocks))
+        if len(all_stocks) < len(screener):
+            print("{} of {} NASDAQ stocks last sold between ${} and ${}".format(len(all_stocks), len(screener),
+                                                                            min_price, max_price))
+        return all_stocks
+
+    def get_screener(self) -> pandas.DataFrame:
+        """ symbol -> lastsale, market_cap, sector, from memory, the disk cache or NASDAQ when older than the TTL """
+        with self.lock:
+            if self._screener is None or time.time() - self._loaded_at > WatchList.TTL_SECONDS:
+                self._screener, self._loaded_at = self._load()
+            return self._screener
+
+    def _load(self):
+        cached, cached_at = None, 0.0
+        if self.path.exists():
+            cached, cached_at = WatchList._read_cache(self.path), self.path.stat().st_mtime
+            if time.time() - cached_at <= WatchList.TTL_SECONDS:
+                return cached, cached_at
 
-        # for stock_type in self.stock_types:
         print("Fetching the best {} {} recommended {} stocks from NASDAQ"
               .format(self.no_of_stocks, self.recommendation_type, self.stocks_type))
-        data = self._get_nasdaq_buy_stocks()
-        nasdaq_records = data['data']['table']['rows']
-        all_stocks = [rec['symbol'].strip().upper() for rec in nasdaq_records]
-        print("Stocks from NASDAQ: ", all_stocks)
-        return all_stocks
+        try:
+            with Metrics.shared().span("universe_fetch"):
+                screener = self._to_table(self._get_nasdaq_buy_stocks()['data']['table']['rows'])
+        except (requests.RequestException, KeyError, TypeError, ValueError) as ex:
+            if cached is None:
+                raise
+            print("Could not refresh the NASDAQ screener ({}), using the one from {}".format(
+                ex, time.ctime(cached_at)))
+            return cached, time.time()
+
+        if cached is not None:
+            print("NASDAQ screener: {} added {}, removed {}".format(len(screener), sorted(
+                set(screener.index) - set(cached.index)), sorted(set(cached.index) - set(screener.index))))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        screener.to_csv(str(self.path) + ".tmp")
+        os.replace(str(self.path) + ".tmp", self.path)
+        return screener, time.time()
+
+    @staticmethod
+    def _read_cache(path: Path) -> pandas.DataFrame:
+        # tickers such as NA or NAN are not missing values, only the prices and market caps can be
+        return pandas.read_csv(path, index_col="symbol", dtype={"symbol": str, "sector": str}, keep_default_na=False,
+                               na_values={"lastsale": [""], "market_cap": [""]})
+
+    @staticmethod
+    def _to_table(nasdaq_records: List[dict]) -> pandas.DataFrame:
+        # e.g. {"symbol": "AAPL ", "lastsale": "$145.85", "marketCap": "2,411,051,210,000", "sector": "Technology"}
+        records = pandas.DataFrame(nasdaq_records)
+        screener = pandas.DataFrame({
+            "symbol": records["symbol"].str.strip().str.upper(),
+            "lastsale": pandas.to_numeric(records["lastsale"].str.replace(r"[$,]", "", regex=True), errors="coerce"),
+            "market_cap": pandas.to_numeric(records["marketCap"].str.replace(",", ""), errors="coerce"),
+            "sector": records["sector"] if "sector" in records else "",
+        })
+        return screener.drop_duplicates("symbol").set_index("symbol")
 
     def _get_nasdaq_buy_stocks(self):
         # api used by https://www.nasdaq.com/market-activity/stocks/screener
@@ -53,10 +131,4 @@ class WatchList(object):
             'user-agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_14_6) AppleWebKit/537.36 '
                           '(KHTML, like Gecko) Chrome/80.0.3987.149 Safari/537.36'
         }
-        try:
-            return requests.get(self.NASDAQ_API_URL, headers=headers).json()
-        except (ConnectTimeout, HTTPError, ReadTimeout, Timeout, ConnectionError) as e:
-            # TODO: colorama
-            print('NASDAQ CONNECTION ERROR: {}'.format(e))
-            time.sleep(randint(2, 5))
-            self._get_nasdaq_buy_stocks()
+        return self.transport.get("nasdaq", self.NASDAQ_API_URL, headers=headers).json()
@@ -1,12 +1,23 @@
+import threading
+import time
+from concurrent.futures import Future, wait
 from dataclasses import dataclass
-from datetime import date
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 import pandas
 
-from schedules.watchlist import WatchList
+from strategies.lw_pick_engine import compute_lw_stocks
+from strategies.strategy import Strategy, register
+from utils.bar_builder import BarBuilder
+from utils.bar_store import TIMEZONE
 from utils.broker import Broker, Timeframe
+from utils.journal import Journal, NoOpJournal
+from utils.market_data import MarketData
+from utils.metrics import Metrics
+from utils.order_executor import OrderExecutor, OrderSignal
+from utils.state_store import StateStore
+from utils.util import load_app_variables
 
 
 @dataclass
@@ -20,7 +31,8 @@ class LWStock:
     step: float
 
 
-class LWBreakout(object):
+@register
+class LWBreakout(Strategy):
     """
         Larry Williams Breakout strategy :
         https://www.whselfinvest.com/en-lu/trading-platform/free-trading-strategies/tradingsystem/56-volatility-break-out-larry-williams-free
@@ -34,134 +46,204 @@ class LWBreakout(object):
 
     AMOUNT_PER_ORDER = 1000
     MAX_NUM_STOCKS = 40
+    MIN_YESTERDAYS_CHANGE = 6
+    STOP_LOSS_STEPS = 2
+    TAKE_PROFIT_STEPS = 4
 
-    def __init__(self, broker: Broker):
+    def __init__(self, broker: Broker, journal: Optional[Journal] = None, market_data: Optional[MarketData] = None):
         self.name = "LWBreakout"
-        self.watchlist = WatchList()
         self.broker = broker
-
+        self.journal = journal or NoOpJournal()
+        # universe, bars and prices, shared with the other strategies of the run
+        self.market_data = market_data or MarketData.from_config(broker)
+
+        config = load_app_variables(self.name) or {}
+        self.streaming = config.get("streaming", False)
+        self.executor = OrderExecutor(self.broker, config.get("max_orders_in_flight", 8), self.journal)
+        # intraday bars of the picks, from the streamed trades or the prices polled every tick
+        self.bar_builder = BarBuilder()
+
+        # picks and traded stocks are snapshotted, so a restart resumes the day without a scan or duplicate entries
+        self.state = StateStore(Path("/".join([Strategy.DATA, "state", self.name])))
+        self.trading_day = pandas.Timestamp.now(tz=TIMEZONE).date()
         self.todays_stock_picks: List[LWStock] = []
         self.stocks_traded_today: List[str] = []
 
+        # state shared between the minute tick and the trade stream
+        self.lock = threading.RLock()
+        self.picks_by_symbol: Dict[str, LWStock] = {}
+        self.held_stocks: List[str] = []
+        self.market_open = False
+        self.entries_stopped = False
+
     def get_algo_name(self) -> str:
         return self.name
 
+    def get_traded_symbols(self) -> List[str]:
+        return list(self.stocks_traded_today)
+
+    def precompute(self):
+        # after the close the day's bars are final, they are all the next trading day's picks depend on
+        day = self.broker.next_trading_day()
+        picks = self._get_todays_picks()
+        self.state.save_records("picks", day, picks, LWStock)
+        print("Saved {} picks for {}".format(len(picks), day))
+
     def initialize(self):
-        self.stocks_traded_today = []
-        self.todays_stock_picks = self._get_todays_picks()
-        self.broker.await_market_open()
-        self.broker.close_all_positions()
+        # the runtime has flattened the account at the open
+        self.resume()
+
+    def resume(self):
+        self.trading_day = pandas.Timestamp.now(tz=TIMEZONE).date()
+        picks = self.state.load_records("picks", self.trading_day, LWStock)
+        if picks is None:
+            picks = self._get_todays_picks()
+            self.state.save_records("picks", self.trading_day, picks, LWStock)
+        else:
+            print("Loaded {} picks precomputed for {}".format(len(picks), self.trading_day))
+        # journaled under the day they are traded, whether scanned now or precomputed the evening before
+        self.journal.record_picks(picks, self.trading_day)
+
+        with self.lock:
+            self.entries_stopped = False
+            self.stocks_traded_today = self.state.load_symbols("traded", self.trading_day) or []
+            self.todays_stock_picks = picks
+            self.picks_by_symbol = {stock.symbol: stock for stock in self.todays_stock_picks}
+        if self.stocks_traded_today:
+            print("Already traded today: {}".format(self.stocks_traded_today))
+
+        if self.streaming:
+            # breakouts fire on the trade that crosses a bound instead of at the next minute tick
+            price_feed = self.broker.stream_prices(list(self.picks_by_symbol))
+            price_feed.add_handler(self.bar_builder.on_trade)
+            price_feed.add_handler(self.on_trade)
 
     def run(self):
-
-        if not self.broker.is_market_open():
+        with Metrics.shared().span("tick"):
+            self._tick()
+
+    def stop_entries(self):
+        with self.lock:
+            self.entries_stopped = True
+        # the orders signalled before are placed, so the close-out sees their positions
+        self.executor.drain()
+
+    def _tick(self):
+        self.market_open = self.broker.is_market_open()
+        if not self.market_open:
             print("Market not open !")
             return
 
         # First check if stock not already purchased
-        held_stocks = [x.symbol for x in self.broker.get_positions()]
+        self.held_stocks = [x.symbol for x in self.broker.get_positions()]
 
+        signals = []
+        now = pandas.Timestamp.now(tz=TIMEZONE)
         for stock in self.todays_stock_picks:
-
-            # Open new positions on stocks only if not already held or if not traded today
-            if stock.symbol not in held_stocks and stock.symbol not in self.stocks_traded_today:
-                current_market_price = self.broker.get_current_price(stock.symbol)
-                trade_count = len(self.stocks_traded_today)
-
-                # long
-                if stock.lw_upper_bound < current_market_price and trade_count < LWBreakout.MAX_NUM_STOCKS:
-                    print("Long: Current market price.. {}: ${}".format(stock.symbol, current_market_price))
-                    no_of_shares = int(LWBreakout.AMOUNT_PER_ORDER / current_market_price)
-                    stop_loss = current_market_price - (2 * stock.step)
-                    take_profit = current_market_price + (4 * stock.step)
-
-                    self.broker.place_bracket_order(stock.symbol, "buy", no_of_shares, stop_loss, take_profit)
-                    self.stocks_traded_today.append(stock.symbol)
-
-                # short
-                if stock.lw_lower_bound > current_market_price and trade_count < LWBreakout.MAX_NUM_STOCKS:
-                    print("Short: Current market price.. {}: ${}".format(stock.symbol, current_market_price))
-                    no_of_shares = int(LWBreakout.AMOUNT_PER_ORDER / current_market_price)
-                    stop_loss = current_market_price + (2 * stock.step)
-                    take_profit = current_market_price - (4 * stock.step)
-
-                    self.broker.place_bracket_order(stock.symbol, "sell", no_of_shares, stop_loss, take_profit)
-                    self.stocks_traded_today.append(stock.symbol)
-
-    def _get_stock_df(self, stock):
-        data_folder = "data"
-        today = date.today().isoformat()
-        df_path = Path("/".join([data_folder, today, stock + ".pkl"]))
-        df_path.parent.mkdir(parents=True, exist_ok=True)
-
-        if df_path.exists():
-            df = pandas.read_pickle(df_path)
-        else:
-            if self.broker.is_tradable(stock):
-                df = self.broker.get_bars(stock, Timeframe.DAY, limit=LWBreakout.BARSET_RECORDS)
-                # df['pct_change'] = round(((df['close'] - df['open']) / df['open']) * 100, 4)
-                # df['net_change'] = 1 + (df['pct_change'] / 100)
-                # df['cum_change'] = df['net_change'].cumprod()
-                df.to_pickle(df_path)
-
-            else:
-                print('stock symbol {} is not tradable with broker'.format(stock))
+            if not self._is_traded(stock.symbol):
+                current_price = self.broker.get_current_price(stock.symbol)
+                if not self.streaming:
+                    self.bar_builder.on_trade(stock.symbol, current_price, 0, now)
+                signal = self._check_breakout(stock, current_price)
+                if signal is not None:
+                    signals.append(signal)
+
+        Metrics.shared().increment("signals", len(signals), source="tick")
+        # all breakouts of the tick are submitted together, the market was checked at the start of the tick
+        wait(self._submit(signals))
+
+    def on_trade(self, symbol: str, price: float, size: float, timestamp) -> None:
+        # only trade while the market is open, _check_breakout refuses entries after the close-out started
+        stock = self.picks_by_symbol.get(symbol)
+        if stock is not None and self.market_open and not self._is_traded(symbol):
+            signal = self._check_breakout(stock, price)
+            if signal is not None:
+                Metrics.shared().increment("signals", source="stream")
+                # don't hold up the stream while the order is in flight
+                self._submit([signal])
+
+    def _submit(self, signals: List[OrderSignal]) -> List[Future]:
+        # under the lock stop_entries takes: an order is either submitted before it drains the executor or not at all
+        with self.lock:
+            if self.entries_stopped:
+                return []
+            return self.executor.submit(signals, wait=False, check_market_open=False)
+
+    def _is_traded(self, symbol: str) -> bool:
+        # Open new positions on stocks only if not already held or if not traded today
+        return symbol in self.held_stocks or symbol in self.stocks_traded_today
+
+    def _check_breakout(self, stock: LWStock, current_market_price: float) -> Optional[OrderSignal]:
+        with self.lock:
+            if self.entries_stopped or self._is_traded(stock.symbol) or \
+                    len(self.stocks_traded_today) >= LWBreakout.MAX_NUM_STOCKS:
                 return None
 
-        return df
+            # long
+            if stock.lw_upper_bound < current_market_price:
+                print("Long: Current market price.. {}: ${}".format(stock.symbol, current_market_price))
+                no_of_shares = int(LWBreakout.AMOUNT_PER_ORDER / current_market_price)
+                stop_loss = current_market_price - (LWBreakout.STOP_LOSS_STEPS * stock.step)
+                take_profit = current_market_price + (LWBreakout.TAKE_PROFIT_STEPS * stock.step)
 
-    def _get_todays_picks(self) -> List[LWStock]:
-        # get the best buy and strong buy stock from Nasdaq.com and sort them by the best stocks
+                return self._signal(OrderSignal(stock.symbol, "buy", no_of_shares, stop_loss, take_profit),
+                                    current_market_price)
 
-        from_watchlist = self.watchlist.get_universe()
-        stock_info = []
+            # short
+            elif stock.lw_lower_bound > current_market_price:
+                print("Short: Current market price.. {}: ${}".format(stock.symbol, current_market_price))
+                no_of_shares = int(LWBreakout.AMOUNT_PER_ORDER / current_market_price)
+                stop_loss = current_market_price + (LWBreakout.STOP_LOSS_STEPS * stock.step)
+                take_profit = current_market_price - (LWBreakout.TAKE_PROFIT_STEPS * stock.step)
 
-        for count, stock in enumerate(from_watchlist):
+                return self._signal(OrderSignal(stock.symbol, "sell", no_of_shares, stop_loss, take_profit),
+                                    current_market_price)
 
-            df = self._get_stock_df(stock)
-            if df is None:
-                continue
+            return None
 
-            stock_price = df.iloc[-1]['close']
-            print(df.iloc[-1])
-            if stock_price > LWBreakout.STOCK_MAX_PRICE or stock_price < LWBreakout.STOCK_MIN_PRICE:
-                continue
+    def _signal(self, signal: OrderSignal, price: float) -> OrderSignal:
+        self.stocks_traded_today.append(signal.symbol)
+        self.state.save_symbols("traded", self.trading_day, self.stocks_traded_today)
+        self.journal.record_signal(signal, price)
+        return signal
 
-            df = self._get_stock_df(stock)
-            price_open = df.iloc[-LWBreakout.MOVED_DAYS]['open']
-            price_close = df.iloc[-1]['close']
-            percent_change = round((price_close - price_open) / price_open * 100, 3)
-            print('[{}/{}] -> {} moved {}% over the last {} days'.format(count + 1, len(from_watchlist),
-                                                                         stock, percent_change, LWBreakout.MOVED_DAYS))
+    def _scan(self, stocks: List[str]) -> pandas.DataFrame:
+        # missing bars are synced concurrently into the bar store, then read back as one panel
+        start = time.perf_counter()
+        tradable = self.broker.filter_tradable(stocks)
+        if len(tradable) < len(stocks):
+            print('stock symbols {} are not tradable with broker'.format(sorted(set(stocks) - set(tradable))))
 
-            yesterdays_record = df.iloc[-2]
-            y_stock_open = yesterdays_record['open']
-            y_stock_high = yesterdays_record['high']
-            y_stock_low = yesterdays_record['low']
-            y_stock_close = yesterdays_record['close']
+        panel = self.market_data.get_bars(tradable, Timeframe.DAY, LWBreakout.BARSET_RECORDS)
 
-            y_change = round((y_stock_close - y_stock_open) / y_stock_open * 100, 3)
-            y_range = y_stock_high - y_stock_low  # yesterday's range
-            step = round(y_range * 0.25, 3)
+        print("Scanned {} stocks with {} workers in {:.2f}s".format(len(stocks), self.market_data.bar_sync.workers,
+                                                                  time.perf_counter() - start))
+        return panel
 
-            weightage = self._calculate_weightage(percent_change, y_change)
-            lw_lower_bound = round(stock_price - step, 3)
-            lw_upper_bound = round(stock_price + step, 3)
+    def _get_todays_picks(self) -> List[LWStock]:
+        # get the best buy and strong buy stock from Nasdaq.com and sort them by the best stocks
 
-            stock_info.append(
-                LWStock(stock, y_change, percent_change, weightage, lw_lower_bound, lw_upper_bound, step))
+        metrics = Metrics.shared()
+        # symbols last sold outside the price band never cost a bar download
+        from_watchlist = self.market_data.get_universe(LWBreakout.STOCK_MIN_PRICE, LWBreakout.STOCK_MAX_PRICE)
+        with metrics.span("scan"):
+            panel = self._scan(from_watchlist)
+
+        start = time.perf_counter()
+        with metrics.span("pick_compute"):
+            biggest_movers = compute_lw_stocks(panel, LWBreakout.MOVED_DAYS, LWBreakout.STOCK_MIN_PRICE,
+                                               LWBreakout.STOCK_MAX_PRICE)
+            stock_picks = [LWStock(**stock) for stock in self._select_best(biggest_movers).to_dict("records")]
+        metrics.increment("picks", len(stock_picks))
+        print('{} of {} stocks priced between ${} and ${}, computed in {:.3f}s'
+              .format(len(biggest_movers), len(from_watchlist), LWBreakout.STOCK_MIN_PRICE,
+                      LWBreakout.STOCK_MAX_PRICE, time.perf_counter() - start))
 
-        biggest_movers = sorted(stock_info, key=lambda i: i.weightage, reverse=True)
-        stock_picks = self._select_best(biggest_movers)
         print('today\'s picks: ')
         [print(stock_pick) for stock_pick in stock_picks]
         print('\n')
         return stock_picks
 
     @staticmethod
-    def _calculate_weightage(moved: float, change_low_to_market: float):
-        return moved + (change_low_to_market * 2)
-
-    @staticmethod
-    def _select_best(biggest_movers):
-        return [x for x in biggest_movers if x.yesterdays_change > 6]
+    def _select_best(biggest_movers: pandas.DataFrame) -> pandas.DataFrame:
+        return biggest_movers[biggest_movers["yesterdays_change"] > LWBreakout.MIN_YESTERDAYS_CHANGE]
@@ -0,0 +1,66 @@
+from typing import Dict, Tuple
+
+import numpy
+import pandas
+
+PICK_FIELDS = ["open", "high", "low", "close"]
+OPEN, HIGH, LOW, CLOSE = range(len(PICK_FIELDS))
+
+
+def to_window(panel: pandas.DataFrame, days: int) -> Tuple[pandas.Index, numpy.ndarray]:
+    """
+        Last `days` bars of every symbol in a (symbol, time) indexed panel, as an array shaped
+        (symbols, days, open/high/low/close). Symbols with fewer than `days` bars are dropped.
+    """
+    window = panel.sort_index()[PICK_FIELDS].groupby(level="symbol", sort=False).tail(days)
+    sizes = window.groupby(level="symbol", sort=False).size()
+    window = window[window.index.get_level_values("symbol").isin(sizes.index[sizes == days])]
+    symbols = window.index.get_level_values("symbol")[::days]
+    return symbols, window.to_numpy(dtype=float).reshape(-1, days, len(PICK_FIELDS))
+
+
+def lw_indicators(bars: numpy.ndarray, moved_days: int) -> Dict[str, numpy.ndarray]:
+    """
+        LW indicators of bar windows shaped (..., days, open/high/low/close), the last bar of each window being the
+        latest. Rounding matches the original per-symbol computation.
+    """
+    stock_price = bars[..., -1, CLOSE]
+    price_open = bars[..., -moved_days, OPEN]
+    moved = numpy.round((stock_price - price_open) / price_open * 100, 3)
+
+    yesterday = bars[..., -2, :]
+    yesterdays_change = numpy.round((yesterday[..., CLOSE] - yesterday[..., OPEN]) / yesterday[..., OPEN] * 100, 3)
+    step = numpy.round((yesterday[..., HIGH] - yesterday[..., LOW]) * 0.25, 3)
+
+    return {
+        "stock_price": stock_price,
+        "yesterdays_change": yesterdays_change,
+        "moved": moved,
+        "weightage": moved + (yesterdays_change * 2),
+        "lw_lower_bound": numpy.round(stock_price - step, 3),
+        "lw_upper_bound": numpy.round(stock_price + step, 3),
+        "step": step,
+    }
+
+
+def compute_lw_stocks(panel: pandas.DataFrame, moved_days: int, min_price: float,
+                      max_price: float) -> pandas.DataFrame:
+    """
+        LWStock columns for every symbol of the panel priced within [min_price, max_price], sorted by weightage
+        (highest first, ties in symbol order).
+    """
+    symbols, bars = to_window(panel, window_days(moved_days))
+
+    stock_price = bars[:, -1, CLOSE]
+    in_band = (stock_price >= min_price) & (stock_price <= max_price)
+    indicators = lw_indicators(bars[in_band], moved_days)
+    del indicators["stock_price"]
+
+    stocks = pandas.DataFrame({"symbol": numpy.asarray(symbols[in_band]), **indicators})
+    order = numpy.argsort(-stocks["weightage"].to_numpy(), kind="stable")
+    return stocks.iloc[order].reset_index(drop=True)
+
+
+def window_days(moved_days: int) -> int:
+    # yesterday's bar is always needed for the step
+    return max(moved_days, 2)
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import strategies.lw_breakout_strategy  # noqa: F401, registers LWBreakout
+from strategies.strategy import STRATEGIES, Strategy
+from utils.broker import Broker
+from utils.journal import Journal, NoOpJournal
+from utils.market_data import MarketData
+from utils.strategy_broker import Ownership, StrategyBroker
+from utils.util import load_app_variables
+
+
+class StrategyRuntime(object):
+    """
+        Runs the registered strategies named in the config side by side. They share the market data of the run and
+        each trades through its own StrategyBroker, limited to its symbols and its budget (`budget` in the strategy's
+        config). A strategy failing a tick doesn't hold up the others.
+    """
+
+    def __init__(self, broker: Broker, names: List[str], market_data: MarketData,
+                 journal: Optional[Journal] = None):
+        journal = journal or NoOpJournal()
+        self.broker = broker
+        self.market_data = market_data
+        self.ownership = Ownership()
+        self.strategies: List[Strategy] = []
+        for name in names:
+            if name not in STRATEGIES:
+                raise ValueError("Unknown strategy {}, registered: {}".format(name, sorted(STRATEGIES)))
+            config = load_app_variables(name) or {}
+            strategy_broker = StrategyBroker(broker, market_data, name, self.ownership, config.get("budget"))
+            self.strategies.append(STRATEGIES[name](strategy_broker, journal=journal.for_strategy(name),
+                                                    market_data=market_data))
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.strategies)), thread_name_prefix="strategy")
+
+    def get_algo_names(self) -> List[str]:
+        return [strategy.get_algo_name() for strategy in self.strategies]
+
+    def precompute(self):
+        self.market_data.expire_bars()
+        self._each(lambda strategy: strategy.precompute())
+
+    def initialize(self):
+        # yesterday's leftovers are flattened on the account as a whole, no strategy owns any symbol yet
+        self.broker.await_market_open()
+        self.broker.cancel_open_orders()
+        self.broker.close_all_positions()
+        self.market_data.reset()
+        self._each(lambda strategy: strategy.initialize())
+
+    def resume(self):
+        self.market_data.reset()
+        self._each(lambda strategy: strategy.resume())
+        # the symbols traded before the restart still belong to their strategy and count against its budget
+        for strategy in self.strategies:
+            strategy.broker.restore(strategy.get_traded_symbols())
+
+    def run(self):
+        self._each(lambda strategy: strategy.run())
+
+    def close_all_positions(self):
+        # no entry may land once a strategy's symbols are closed and released
+        self._each(lambda strategy: strategy.stop_entries())
+        self._each(lambda strategy: strategy.broker.close_all_positions())
+
+    def _each(self, call) -> None:
+        futures = [(strategy, self.pool.submit(call, strategy)) for strategy in self.strategies]
+        for strategy, future in futures:
+            try:
+                future.result()
+            except Exception as ex:
+                print("{} failed: {!r}".format(strategy.get_algo_name(), ex))
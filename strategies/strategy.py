@@ -1,4 +1,7 @@
 from pathlib import Path
+from typing import Dict, List, Type
+
+from utils.bar_store import BarStore
 
 
 class Strategy(object):
@@ -17,6 +20,38 @@ class Strategy(object):
     def define_buy_sell(self, data):
         pass
 
+    def precompute(self):
+        """ After the close, prepares the next trading day (e.g. its picks) """
+        pass
+
+    def initialize(self):
+        """ Pre-market preparation, e.g. the day's picks """
+        pass
+
+    def resume(self):
+        """ Picks the day up again after a restart during the session """
+        pass
+
+    def run(self):
+        """ One tick during market hours """
+        pass
+
+    def stop_entries(self):
+        """ Before the close-out: no new positions for the rest of the day """
+        pass
+
+    def get_traded_symbols(self) -> List[str]:
+        return []
+
     @staticmethod
-    def get_backtest_file_path(symbol) -> Path:
-        return Path("/".join([Strategy.DATA, "back-test", symbol + ".pkl"]))
\ No newline at end of file
+    def get_bar_store() -> BarStore:
+        return BarStore(Path("/".join([Strategy.DATA, "bars"])))
+
+
+# strategy name -> class, the names are used in conf/config.yml
+STRATEGIES: Dict[str, Type[Strategy]] = {}
+
+
+def register(cls: Type[Strategy]) -> Type[Strategy]:
+    STRATEGIES[cls.__name__] = cls
+    return cls
@@ -0,0 +1,41 @@
+from typing import List, Optional
+
+import pytest
+
+from strategies.strategy import Strategy
+from utils.bar_store import BarStore
+from utils.dry_run_broker import DryRunBroker
+from utils.market_data import MarketData
+from utils.market_stream import ReplayTradeStream
+from utils.simulated_broker import SimulatedBroker
+
+
+class StaticWatchList(object):
+
+    def __init__(self, symbols: List[str]):
+        self.symbols = symbols
+
+    def get_universe(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[str]:
+        return list(self.symbols)
+
+
+@pytest.fixture(autouse=True)
+def data_folder(tmp_path, monkeypatch):
+    # state, bars and reports go to a throwaway folder
+    monkeypatch.setattr(Strategy, "DATA", str(tmp_path))
+
+
+@pytest.fixture
+def trade_stream() -> ReplayTradeStream:
+    return ReplayTradeStream()
+
+
+@pytest.fixture
+def broker(trade_stream) -> DryRunBroker:
+    # market data from the simulator, streamed prices from the replayed trades, orders filled by the dry run
+    return DryRunBroker(SimulatedBroker(5, trade_stream=trade_stream))
+
+
+@pytest.fixture
+def market_data(broker, tmp_path) -> MarketData:
+    return MarketData(broker, StaticWatchList(broker.broker.symbols), BarStore(tmp_path / "bars"))
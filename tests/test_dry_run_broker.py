@@ -0,0 +1,56 @@
+import pytest
+
+SYMBOL = "S0001"
+
+
+@pytest.fixture
+def bracket(broker, trade_stream):
+    # long 10 shares at 100, take profit at 110, stop loss at 95
+    broker.stream_prices([SYMBOL])
+    trade_stream.push_trade(SYMBOL, 100.0)
+    order = broker.place_bracket_order(SYMBOL, "buy", 10, stop_loss=95.0, take_profit=110.0)
+    assert order.status == "filled" and order.price == 100.0
+    return order
+
+
+def test_take_profit_leg_closes_the_position(broker, trade_stream, bracket):
+    fills = []
+    broker.sync_portfolio().add_fill_handler(fills.append)
+
+    trade_stream.push_trade(SYMBOL, 105.0)
+    assert broker.get_positions()[0].qty == 10
+    trade_stream.push_trade(SYMBOL, 112.0)
+
+    assert broker.get_positions() == []
+    assert [(fill.side, fill.qty, fill.price) for fill in fills] == [("sell", 10, 110.0)]
+    assert broker.get_portfolio().realized_pl == pytest.approx(100.0)
+    assert broker.sync_portfolio().get_open_orders() == []
+
+
+def test_stop_loss_leg_fills_at_the_trade_price(broker, trade_stream, bracket):
+    trade_stream.push_trade(SYMBOL, 94.0)
+
+    assert broker.get_positions() == []
+    assert broker.get_portfolio().realized_pl == pytest.approx(-60.0)
+    # the take profit leg was canceled with it, later trades don't fill it
+    trade_stream.push_trade(SYMBOL, 120.0)
+    assert broker.get_positions() == []
+    assert broker.sync_portfolio().get_open_orders() == []
+
+
+def test_close_all_positions_cancels_the_legs(broker, trade_stream, bracket):
+    trade_stream.push_trade(SYMBOL, 103.0)
+    broker.close_all_positions()
+
+    assert broker.get_positions() == []
+    assert broker.get_portfolio().realized_pl == pytest.approx(30.0)
+    trade_stream.push_trade(SYMBOL, 90.0)
+    assert broker.get_positions() == []
+
+
+def test_orders_without_shares_are_refused(broker, trade_stream):
+    broker.stream_prices([SYMBOL])
+    trade_stream.push_trade(SYMBOL, 100.0)
+
+    assert broker.place_bracket_order(SYMBOL, "buy", 0, stop_loss=95.0, take_profit=110.0) is None
+    assert broker.get_positions() == []
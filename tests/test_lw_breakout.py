@@ -0,0 +1,83 @@
+import pytest
+
+from strategies.lw_breakout_strategy import LWBreakout, LWStock
+
+PICKS = [LWStock("S0001", 8.0, 10.0, 1.0, 90.0, 100.0, 2.0), LWStock("S0002", 7.0, 10.0, 0.9, 40.0, 50.0, 1.0)]
+
+
+@pytest.fixture
+def strategy(broker, market_data) -> LWBreakout:
+    # the day's picks were precomputed, the strategy reacts to the replayed trades while the market is open
+    strategy = LWBreakout(broker, market_data=market_data)
+    strategy.streaming = True
+    strategy.state.save_records("picks", strategy.trading_day, PICKS, LWStock)
+    strategy.resume()
+    strategy.market_open = True
+    return strategy
+
+
+def test_breakout_fires_on_the_crossing_trade(broker, trade_stream, strategy):
+    trade_stream.push_trade("S0001", 95.0)
+    strategy.executor.drain()
+    assert broker.get_positions() == []
+
+    trade_stream.push_trade("S0001", 101.0)
+    strategy.executor.drain()
+
+    [position] = broker.get_positions()
+    assert (position.symbol, position.qty, position.avg_entry_price) == ("S0001", 9, 101.0)
+    assert strategy.get_traded_symbols() == ["S0001"]
+
+
+def test_short_breakout_below_the_lower_bound(broker, trade_stream, strategy):
+    trade_stream.push_trade("S0002", 39.0)
+    strategy.executor.drain()
+
+    [position] = broker.get_positions()
+    assert (position.symbol, position.qty) == ("S0002", -25)
+
+
+def test_a_symbol_is_entered_once_a_day(broker, trade_stream, strategy):
+    trade_stream.push_trade("S0001", 101.0)
+    strategy.executor.drain()
+    broker.close_all_positions()
+
+    trade_stream.push_trade("S0001", 102.0)
+    strategy.executor.drain()
+
+    assert broker.get_positions() == []
+    assert broker.order_count == 1
+
+
+def test_bracket_legs_follow_the_pick_step(broker, trade_stream, strategy):
+    trade_stream.push_trade("S0001", 101.0)
+    strategy.executor.drain()
+
+    # stop loss 2 steps below the entry, take profit 4 steps above
+    trade_stream.push_trade("S0001", 108.0)
+    assert broker.get_positions()[0].qty == 9
+    trade_stream.push_trade("S0001", 109.5)
+    assert broker.get_positions() == []
+    assert broker.get_portfolio().realized_pl == pytest.approx(9 * 8.0)
+
+
+def test_no_entry_after_the_close_out_started(broker, trade_stream, strategy):
+    strategy.stop_entries()
+
+    trade_stream.push_trade("S0001", 101.0)
+    trade_stream.push_trade("S0002", 39.0)
+    strategy.executor.drain()
+
+    assert broker.get_positions() == []
+    assert broker.order_count == 0
+    assert strategy.get_traded_symbols() == []
+
+
+def test_entries_resume_on_the_next_day(broker, trade_stream, strategy):
+    strategy.stop_entries()
+    strategy.resume()
+
+    trade_stream.push_trade("S0001", 101.0)
+    strategy.executor.drain()
+
+    assert [position.symbol for position in broker.get_positions()] == ["S0001"]
@@ -0,0 +1,68 @@
+import pandas
+import pytest
+
+from utils.market_stream import ReplayTradeStream
+from utils.portfolio_state import PortfolioState
+
+SNAPSHOT = pandas.Timestamp("2021-09-20 13:30", tz="UTC")
+
+
+@pytest.fixture
+def portfolio_state(trade_stream: ReplayTradeStream) -> PortfolioState:
+    portfolio_state = PortfolioState()
+    trade_stream.subscribe_trade_updates(portfolio_state.on_trade_update)
+    return portfolio_state
+
+
+def order(order_id="1", symbol="AAPL", side="buy", qty=100, filled_qty=0):
+    return {"id": order_id, "symbol": symbol, "side": side, "qty": qty, "filled_qty": filled_qty}
+
+
+class RestPosition(object):
+
+    def __init__(self, symbol, qty, avg_entry_price):
+        self.symbol = symbol
+        self.qty = str(abs(qty))
+        self.side = "long" if qty > 0 else "short"
+        self.avg_entry_price = str(avg_entry_price)
+        self.current_price = str(avg_entry_price)
+
+
+def test_cumulative_fill_quantities_are_applied_once(trade_stream, portfolio_state):
+    fills = []
+    portfolio_state.add_fill_handler(fills.append)
+    portfolio_state.load([], [order()])
+
+    trade_stream.push_trade_update("partial_fill", order(), 10.0, 40, SNAPSHOT)
+    trade_stream.push_trade_update("partial_fill", order(), 10.0, 40, SNAPSHOT)  # delivered twice
+    trade_stream.push_trade_update("fill", order(), 11.0, 100, SNAPSHOT)
+    trade_stream.push_trade_update("fill", order(), 11.0, 100, SNAPSHOT)
+
+    [position] = portfolio_state.get_positions()
+    assert position.qty == 100
+    assert position.avg_entry_price == pytest.approx((40 * 10.0 + 60 * 11.0) / 100)
+    assert [fill.qty for fill in fills] == [40, 60]
+    assert portfolio_state.get_open_orders() == []
+
+
+def test_fills_before_the_snapshot_are_not_applied_again(trade_stream, portfolio_state):
+    # subscribed, then a partial fill arrives before the REST snapshot that already includes it
+    trade_stream.push_trade_update("partial_fill", order(), 10.0, 40, SNAPSHOT - pandas.Timedelta(seconds=1))
+    trade_stream.push_trade_update("partial_fill", order(), 10.0, 70, SNAPSHOT + pandas.Timedelta(seconds=1))
+    assert portfolio_state.get_positions() == []
+
+    portfolio_state.load([RestPosition("AAPL", 40, 10.0)], [order(filled_qty=40)], as_of=SNAPSHOT)
+
+    [position] = portfolio_state.get_positions()
+    assert position.qty == 70
+    trade_stream.push_trade_update("fill", order(), 10.0, 100, SNAPSHOT + pandas.Timedelta(seconds=2))
+    assert portfolio_state.get_positions()[0].qty == 100
+
+
+def test_closing_fill_flattens_the_position(trade_stream, portfolio_state):
+    portfolio_state.load([RestPosition("AAPL", -50, 20.0)], [])
+
+    trade_stream.push_trade_update("fill", order("2", side="buy", qty=50), 19.0, 50, SNAPSHOT)
+
+    assert portfolio_state.get_positions() == []
+    assert portfolio_state.wait_until_flat(0, ["AAPL"])
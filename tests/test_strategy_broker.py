@@ -0,0 +1,64 @@
+import pytest
+
+from utils.strategy_broker import Ownership, StrategyBroker
+
+
+@pytest.fixture
+def ownership() -> Ownership:
+    return Ownership()
+
+
+@pytest.fixture
+def strategies(broker, market_data, ownership, trade_stream):
+    # two strategies trading through the same account, every symbol priced at 100 by the stream
+    market_data.stream_prices(broker.broker.symbols)
+    for symbol in broker.broker.symbols:
+        trade_stream.push_trade(symbol, 100.0)
+    return (StrategyBroker(broker, market_data, "first", ownership, budget=1500),
+            StrategyBroker(broker, market_data, "second", ownership))
+
+
+def test_a_symbol_is_traded_by_one_strategy(strategies, ownership):
+    first, second = strategies
+
+    assert first.place_bracket_order("S0001", "buy", 10, 95.0, 110.0) is not None
+    assert second.place_bracket_order("S0001", "sell", 10, 105.0, 90.0) is None
+    assert ownership.owned_by("first") == ["S0001"]
+    assert [position.symbol for position in first.get_positions()] == ["S0001"]
+    assert second.get_positions() == []
+
+
+def test_orders_over_the_budget_are_refused_and_their_symbol_released(strategies, ownership):
+    first, second = strategies
+
+    assert first.place_bracket_order("S0001", "buy", 10, 95.0, 110.0) is not None
+    assert first.place_bracket_order("S0002", "buy", 10, 95.0, 110.0) is None
+    assert ownership.owned_by("first") == ["S0001"]
+    assert second.place_bracket_order("S0002", "buy", 10, 95.0, 110.0) is not None
+
+
+def test_closing_out_releases_the_symbols_and_the_budget(broker, strategies, ownership):
+    first, second = strategies
+    first.place_bracket_order("S0001", "buy", 10, 95.0, 110.0)
+    second.place_bracket_order("S0002", "buy", 10, 95.0, 110.0)
+
+    first.close_all_positions()
+
+    assert ownership.owned_by("first") == []
+    assert first.committed == {}
+    # only the strategy's own symbols are closed
+    assert [position.symbol for position in broker.get_positions()] == ["S0002"]
+    assert first.place_bracket_order("S0003", "buy", 10, 95.0, 110.0) is not None
+    assert second.place_bracket_order("S0001", "buy", 10, 95.0, 110.0) is not None
+
+
+def test_restore_claims_the_symbols_traded_before_a_restart(broker, market_data, strategies):
+    first, _ = strategies
+    first.place_bracket_order("S0001", "buy", 10, 95.0, 110.0)
+
+    restarted = StrategyBroker(broker, market_data, "first", Ownership(), budget=1500)
+    restarted.restore(["S0001"])
+
+    assert restarted.ownership.owned_by("first") == ["S0001"]
+    assert restarted.committed == {"S0001": pytest.approx(1000.0)}
+    assert restarted.place_bracket_order("S0002", "buy", 10, 95.0, 110.0) is None
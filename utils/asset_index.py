@@ -0,0 +1,62 @@
+import json
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from alpaca_trade_api import REST
+
+
+class AssetIndex(object):
+    """
+        Symbol -> asset attributes for every active asset of the broker, refreshed with a single list_assets call
+        per day and kept on disk so restarts on the same day don't hit the API again.
+    """
+    FOLDER = Path("/".join(["data", "assets"]))
+
+    def __init__(self, api: REST, folder: Path = FOLDER):
+        self.api = api
+        self.folder = folder
+        self.lock = threading.Lock()
+        self._assets: Optional[Dict[str, dict]] = None
+        self._loaded_on: Optional[date] = None
+
+    def get_assets(self) -> Dict[str, dict]:
+        with self.lock:
+            today = date.today()
+            if self._assets is None or self._loaded_on != today:
+                self._assets = self._load(today)
+                self._loaded_on = today
+            return self._assets
+
+    def is_tradable(self, symbol: str) -> bool:
+        return self.get_assets().get(symbol, {}).get("tradable", False)
+
+    def filter_tradable(self, symbols: List[str]) -> List[str]:
+        assets = self.get_assets()
+        return [symbol for symbol in symbols if assets.get(symbol, {}).get("tradable", False)]
+
+    def _load(self, today: date) -> Dict[str, dict]:
+        path = self.folder / (today.isoformat() + ".json")
+        if path.exists():
+            with open(path) as f:
+                return json.load(f)
+
+        print("Refreshing asset index from broker ...")
+        assets = {asset.symbol: {"tradable": asset.tradable,
+                                 "shortable": asset.shortable,
+                                 "easy_to_borrow": asset.easy_to_borrow,
+                                 "exchange": asset.exchange}
+                  for asset in self.api.list_assets(status="active")}
+
+        self.folder.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(assets, f)
+        tmp_path.replace(path)
+
+        # only today's index is ever read
+        for stale in self.folder.glob("*.json"):
+            if stale != path:
+                stale.unlink()
+        return assets
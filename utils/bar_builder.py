@@ -0,0 +1,161 @@
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+
+from utils.bar_store import BAR_DTYPE, to_frame, to_ns
+from utils.bar_sync import BAR_DURATION
+from utils.broker import Timeframe
+
+# sessions are split 5 hours after midnight UTC, i.e. at midnight or 1am in New York, never during trading hours
+SESSION_OFFSET = pandas.Timedelta(hours=5).value
+DAY = pandas.Timedelta(days=1).value
+
+
+@dataclass
+class BarIndicators:
+    atr: float  # average true range of the closed bars, NaN until `atr_period` bars have closed
+    vwap: float  # volume weighted average price of the session
+    session_high: float
+    session_low: float
+
+    @property
+    def range(self) -> float:
+        return self.session_high - self.session_low
+
+
+class _BarSeries(object):
+    """ Bars of one symbol and timeframe: closed bars in a ring buffer, the forming bar and a Wilder ATR """
+    __slots__ = ("period", "capacity", "atr_period", "ring", "closed", "forming", "prev_close", "atr", "tr_sum")
+
+    def __init__(self, period: int, capacity: int, atr_period: int):
+        self.period = period
+        self.capacity = capacity
+        self.atr_period = atr_period
+        self.ring = numpy.zeros(capacity, dtype=BAR_DTYPE)
+        self.closed = 0
+        self.forming: Optional[List[float]] = None  # time, open, high, low, close, volume
+        self.prev_close = math.nan
+        self.atr = math.nan
+        self.tr_sum = 0.0
+
+    def on_trade(self, ns: int, price: float, size: float) -> None:
+        start = ns - ns % self.period
+        forming = self.forming
+        if forming is None or start > forming[0]:
+            if forming is not None:
+                self._close(forming)
+            self.forming = [start, price, price, price, price, size]
+        elif start == forming[0]:
+            if price > forming[2]:
+                forming[2] = price
+            if price < forming[3]:
+                forming[3] = price
+            forming[4] = price
+            forming[5] += size
+        # trades reported late for an already closed bar are dropped
+
+    def read(self, include_forming: bool) -> numpy.ndarray:
+        if self.closed > self.capacity:
+            head = self.closed % self.capacity
+            bars = numpy.concatenate([self.ring[head:], self.ring[:head]])
+        else:
+            bars = self.ring[:self.closed].copy()
+        if include_forming and self.forming is not None:
+            bars = numpy.append(bars, numpy.array([tuple(self.forming)], dtype=BAR_DTYPE))
+        return bars
+
+    def _close(self, bar: List[float]) -> None:
+        self.ring[self.closed % self.capacity] = tuple(bar)
+        self.closed += 1
+
+        _, _, high, low, close, _ = bar
+        true_range = high - low if math.isnan(self.prev_close) else \
+            max(high, self.prev_close) - min(low, self.prev_close)
+        self.prev_close = close
+        if self.closed < self.atr_period:
+            self.tr_sum += true_range
+        elif self.closed == self.atr_period:
+            self.atr = (self.tr_sum + true_range) / self.atr_period
+        else:
+            self.atr += (true_range - self.atr) / self.atr_period
+
+
+class _Session(object):
+    __slots__ = ("key", "notional", "volume", "high", "low", "last")
+
+    def __init__(self, key: int, price: float):
+        self.key = key
+        self.notional = 0.0
+        self.volume = 0.0
+        self.high = price
+        self.low = price
+        self.last = price
+
+
+class BarBuilder(object):
+    """
+        Aggregates trades, streamed or polled, into intraday OHLCV bars per symbol and timeframe. Closed bars are kept
+        in fixed size ring buffers of `capacity` bars, the ATR, session VWAP and session range are updated in constant
+        time per trade. on_trade has the TradeHandler signature, so the builder can be added to a PriceFeed.
+    """
+    TIMEFRAMES = (Timeframe.MIN_1, Timeframe.MIN_5, Timeframe.MIN_15)
+    CAPACITY = 390  # a regular session of 1 minute bars
+    ATR_PERIOD = 14
+
+    def __init__(self, timeframes: Tuple[Timeframe, ...] = TIMEFRAMES, capacity: int = CAPACITY,
+                 atr_period: int = ATR_PERIOD):
+        self.periods = {timeframe: BAR_DURATION[timeframe].value for timeframe in timeframes}
+        self.capacity = capacity
+        self.atr_period = atr_period
+        self.lock = threading.Lock()
+        self.series: Dict[Tuple[str, Timeframe], _BarSeries] = {}
+        self.sessions: Dict[str, _Session] = {}
+
+    def on_trade(self, symbol: str, price: float, size: float, timestamp) -> None:
+        """ Adds a trade, size is 0 for polled prices (they move the bars but not the VWAP) """
+        if isinstance(timestamp, int):
+            ns = timestamp  # nanoseconds since the epoch, as in the raw stream messages
+        elif isinstance(timestamp, pandas.Timestamp) and timestamp.tzinfo is not None:
+            ns = timestamp.value
+        else:
+            ns = to_ns(timestamp)
+        with self.lock:
+            session = self.sessions.get(symbol)
+            key = (ns - SESSION_OFFSET) // DAY
+            if session is None or session.key != key:
+                session = self.sessions[symbol] = _Session(key, price)
+            session.notional += price * size
+            session.volume += size
+            session.high = max(session.high, price)
+            session.low = min(session.low, price)
+            session.last = price
+
+            for timeframe, period in self.periods.items():
+                series = self.series.get((symbol, timeframe))
+                if series is None:
+                    series = self.series[(symbol, timeframe)] = _BarSeries(period, self.capacity, self.atr_period)
+                series.on_trade(ns, price, size)
+
+    def symbols(self) -> List[str]:
+        with self.lock:
+            return list(self.sessions)
+
+    def bars(self, symbol: str, timeframe: Timeframe, include_forming: bool = True) -> pandas.DataFrame:
+        """ The bars of a symbol in time order, the last one still forming unless include_forming is False """
+        with self.lock:
+            series = self.series.get((symbol, timeframe))
+            bars = series.read(include_forming) if series is not None else numpy.empty(0, dtype=BAR_DTYPE)
+        return to_frame(bars)
+
+    def indicators(self, symbol: str, timeframe: Timeframe) -> Optional[BarIndicators]:
+        with self.lock:
+            series = self.series.get((symbol, timeframe))
+            session = self.sessions.get(symbol)
+            if series is None or session is None:
+                return None
+            vwap = session.notional / session.volume if session.volume else session.last
+            return BarIndicators(series.atr, vwap, session.high, session.low)
@@ -0,0 +1,167 @@
+import bisect
+import io
+from pathlib import Path
+from typing import List, Optional
+
+import numpy
+import pandas
+from numpy.lib import format as npy_format
+
+from utils.broker import BAR_FIELDS, Timeframe, bars_panel
+
+BAR_DTYPE = numpy.dtype([("time", "<i8")] + [(field, "<f8") for field in BAR_FIELDS])
+TIMEZONE = "America/New_York"
+
+
+class BarStore(object):
+    """
+        Columnar bar store shared by the live strategies and the backtester. Bars are partitioned by timeframe and
+        symbol into time sorted structured arrays (<folder>/<timeframe>/<SYMBOL>.npy), which are memory-mapped on
+        read: a date range query only touches the pages it slices and never deserializes the whole history.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+
+    def symbols(self, timeframe: Timeframe) -> List[str]:
+        return sorted(path.stem for path in (self.folder / timeframe.value).glob("*.npy"))
+
+    def contains(self, symbol: str, timeframe: Timeframe) -> bool:
+        return self._path(symbol, timeframe).exists()
+
+    def read_array(self, symbol: str, timeframe: Timeframe) -> numpy.ndarray:
+        """ Zero-copy, read-only view of all bars of a symbol """
+        path = self._path(symbol, timeframe)
+        if not path.exists():
+            return numpy.empty(0, dtype=BAR_DTYPE)
+        return numpy.load(path, mmap_mode="r")
+
+    def read_range(self, symbol: str, timeframe: Timeframe, start: Optional[pandas.Timestamp] = None,
+                   end: Optional[pandas.Timestamp] = None) -> numpy.ndarray:
+        """ Zero-copy view of the bars of a symbol with start <= time <= end """
+        bars = self.read_array(symbol, timeframe)
+        # bisect reads a few elements of the mapped file, numpy.searchsorted would copy the whole strided time column
+        times = bars["time"]
+        lo = 0 if start is None else bisect.bisect_left(times, to_ns(start))
+        hi = len(bars) if end is None else bisect.bisect_right(times, to_ns(end))
+        return bars[lo:hi]
+
+    def count(self, symbol: str, timeframe: Timeframe) -> int:
+        """ Number of stored bars of a symbol, from the header of its mapped file """
+        return len(self.read_array(symbol, timeframe))
+
+    def last_timestamp(self, symbol: str, timeframe: Timeframe) -> Optional[pandas.Timestamp]:
+        bars = self.read_array(symbol, timeframe)
+        if len(bars) == 0:
+            return None
+        return pandas.Timestamp(int(bars["time"][-1]), tz="UTC").tz_convert(TIMEZONE)
+
+    def read(self, symbols: List[str], timeframe: Timeframe, start: Optional[pandas.Timestamp] = None,
+             end: Optional[pandas.Timestamp] = None) -> pandas.DataFrame:
+        """ Bars of the given symbols between start and end as a (symbol, time) indexed panel """
+        frames = {}
+        for symbol in symbols:
+            bars = self.read_range(symbol, timeframe, start, end)
+            if len(bars) > 0:
+                frames[symbol] = to_frame(bars)
+        return bars_panel(frames)
+
+    def tail(self, symbols: List[str], timeframe: Timeframe, limit: int) -> pandas.DataFrame:
+        """ Last `limit` bars of the given symbols as a (symbol, time) indexed panel """
+        frames = {}
+        for symbol in symbols:
+            bars = self.read_array(symbol, timeframe)[-limit:]
+            if len(bars) > 0:
+                frames[symbol] = to_frame(bars)
+        return bars_panel(frames)
+
+    def append(self, panel: pandas.DataFrame, timeframe: Timeframe, replace: bool = False) -> None:
+        """
+            Merge a (symbol, time) indexed panel into the store. Stored bars between the first and the last new bar of a
+            symbol are overwritten, so re-fetching the current (incomplete) bar updates it in place. Bars that all come
+            after the stored ones are appended to the file instead of rewriting it, e.g. a backfill window by window.
+        """
+        for symbol, df in panel.groupby(level="symbol"):
+            new_bars = _to_array(df.droplevel("symbol"))
+            if len(new_bars) == 0:
+                continue
+
+            path = self._path(symbol, timeframe)
+            if not replace and path.exists():
+                last = self.last_timestamp(symbol, timeframe)
+                if last is not None and new_bars["time"][0] > last.value and self._extend(path, new_bars):
+                    continue
+                stored = numpy.load(path)
+                before = numpy.searchsorted(stored["time"], new_bars["time"][0], side="left")
+                after = numpy.searchsorted(stored["time"], new_bars["time"][-1], side="right")
+                new_bars = numpy.concatenate([stored[:before], new_bars, stored[after:]])
+            self._write(path, new_bars)
+
+    @staticmethod
+    def _extend(path: Path, bars: numpy.ndarray) -> bool:
+        """
+            Appends bars to a stored array in place: the bars are written after the stored ones, then the header is
+            rewritten with the new length. numpy pads the header for the length to grow, when it can't the caller
+            rewrites the file. Readers mapping the file meanwhile see the old length.
+        """
+        with open(path, "r+b") as f:
+            version = npy_format.read_magic(f)
+            read_header = npy_format.read_array_header_1_0 if version == (1, 0) else npy_format.read_array_header_2_0
+            shape, fortran_order, dtype = read_header(f)
+            if dtype != bars.dtype or fortran_order:
+                return False
+            header_length = f.tell()
+
+            header = io.BytesIO()
+            write_header = npy_format.write_array_header_1_0 if version == (1, 0) else \
+                npy_format.write_array_header_2_0
+            write_header(header, {"descr": npy_format.dtype_to_descr(dtype), "fortran_order": False,
+                                  "shape": (shape[0] + len(bars),)})
+            if len(header.getvalue()) != header_length:
+                return False
+
+            f.seek(header_length + shape[0] * dtype.itemsize)
+            f.write(bars.tobytes())
+            f.flush()
+            f.seek(0)
+            f.write(header.getvalue())
+        return True
+
+    def _write(self, path: Path, bars: numpy.ndarray) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            numpy.save(f, bars)
+        # readers holding a memory map of the old file keep seeing the old bars
+        tmp_path.replace(path)
+
+    def _path(self, symbol: str, timeframe: Timeframe) -> Path:
+        return self.folder / timeframe.value / (symbol + ".npy")
+
+
+def to_ns(timestamp) -> int:
+    """ Nanoseconds since the epoch (UTC) of a timestamp, naive ones being in the market's timezone """
+    timestamp = pandas.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(TIMEZONE)
+    return timestamp.value
+
+
+def _to_array(df: pandas.DataFrame) -> numpy.ndarray:
+    df = df.sort_index()
+    df = df[~df.index.duplicated(keep="last")]
+    index = pandas.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize(TIMEZONE)
+
+    bars = numpy.empty(len(df), dtype=BAR_DTYPE)
+    bars["time"] = numpy.asarray(index.tz_convert("UTC").tz_localize(None), dtype="datetime64[ns]").view("<i8")
+    for field in BAR_FIELDS:
+        bars[field] = df[field].to_numpy(dtype=float)
+    return bars
+
+
+def to_frame(bars: numpy.ndarray) -> pandas.DataFrame:
+    """ OHLCV frame indexed by the market time of bars in the BAR_DTYPE layout """
+    index = pandas.DatetimeIndex(pandas.to_datetime(bars["time"], utc=True), name="time").tz_convert(TIMEZONE)
+    return pandas.DataFrame({field: bars[field] for field in BAR_FIELDS}, index=index)
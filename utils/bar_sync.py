@@ -0,0 +1,117 @@
+import math
+from collections import defaultdict
+from typing import List, Optional
+
+import pandas
+
+from utils.bar_store import TIMEZONE, BarStore
+from utils.broker import Broker, Timeframe
+from utils.concurrency import TokenBucket, bounded_map
+from utils.metrics import Metrics
+from utils.util import chunked
+
+BAR_DURATION = {
+    Timeframe.MIN_1: pandas.Timedelta(minutes=1),
+    Timeframe.MIN_5: pandas.Timedelta(minutes=5),
+    Timeframe.MIN_15: pandas.Timedelta(minutes=15),
+}
+EXTENDED_HOURS = pandas.Timedelta(hours=16)  # 4:00 to 20:00, the longest a day of intraday bars can span
+
+
+def bars_per_day(timeframe: Timeframe) -> int:
+    """ Most bars a symbol can have in one day, extended hours included """
+    return 1 if timeframe == Timeframe.DAY else EXTENDED_HOURS // BAR_DURATION[timeframe]
+
+
+class BarSync(object):
+    """
+        Brings the bar store up to date. Only the bars since the last stored bar of each symbol are requested (the
+        last stored bar is fetched again, in case it was still forming), symbols with equal gaps share a request.
+        Symbols with fewer stored bars than the history asked for, e.g. kept for a shorter lookback, get it in full.
+    """
+    CHUNK_SIZE = 200
+    MAX_BARS_PER_REQUEST = 1000
+
+    def __init__(self, broker: Broker, bar_store: BarStore, workers: int = 1,
+                 rate_limiter: Optional[TokenBucket] = None):
+        self.broker = broker
+        self.bar_store = bar_store
+        self.workers = workers
+        self.rate_limiter = rate_limiter
+
+    def sync(self, symbols: List[str], timeframe: Timeframe, history: int, replace: bool = False) -> None:
+        by_gap = defaultdict(list)
+        for symbol in symbols:
+            gap = history if replace else self._missing_bars(symbol, timeframe, history)
+            by_gap[gap].append(symbol)
+
+        requests = [(chunk, gap) for gap, group in sorted(by_gap.items())
+                    for chunk in chunked(group, BarSync.CHUNK_SIZE)]
+        print("Syncing {} {} bars for {} symbols in {} requests".format(timeframe.value, sum(
+            gap * len(group) for gap, group in by_gap.items()), len(symbols), len(requests)))
+        bounded_map(lambda request: self._download(*request, timeframe, replace), requests, self.workers)
+
+    def sync_range(self, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                   end: pandas.Timestamp, replace: bool = False) -> None:
+        """
+            Downloads the bars between start and end, e.g. years of minute bars, a window of business days at a time.
+            A window is short enough for its bars to fit in one request, each chunk of symbols walks the windows in
+            order and appends them as they come, and symbols already stored over the whole range are skipped (unless
+            `replace`, then the stored bars are replaced by the range).
+        """
+        days = pandas.bdate_range(pandas.Timestamp(start).date(), pandas.Timestamp(end).date())
+        if len(days) == 0:
+            return
+        first_day, last_day = days[0].date(), days[-1].date()
+        missing = [symbol for symbol in symbols
+                   if replace or not self._covers(symbol, timeframe, first_day, last_day)]
+        window_days = max(1, BarSync.MAX_BARS_PER_REQUEST // bars_per_day(timeframe))
+        windows = [(days[i], days[min(i + window_days, len(days)) - 1]) for i in range(0, len(days), window_days)]
+
+        chunks = list(chunked(missing, BarSync.CHUNK_SIZE))
+        print("Syncing {} bars from {} to {} for {} of {} symbols in {} requests".format(
+            timeframe.value, first_day, last_day, len(missing), len(symbols), len(chunks) * len(windows)))
+        bounded_map(lambda chunk: self._download_windows(chunk, windows, timeframe, replace), chunks, self.workers)
+
+    def _download_windows(self, symbols: List[str], windows: List, timeframe: Timeframe, replace: bool) -> None:
+        # the windows of a symbol are appended one after the other, never concurrently
+        for i, (first, last) in enumerate(windows):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            start = pandas.Timestamp(first.date(), tz=TIMEZONE)
+            end = pandas.Timestamp(last.date(), tz=TIMEZONE) + pandas.Timedelta(days=1) - pandas.Timedelta(seconds=1)
+            metrics = Metrics.shared()
+            with metrics.span("bar_download", timeframe=timeframe.value):
+                panel = self.broker.get_bars_range(symbols, timeframe, start, end, BarSync.MAX_BARS_PER_REQUEST)
+            metrics.increment("bar_download_symbols", len(symbols), timeframe=timeframe.value)
+            if len(panel) > 0:
+                self.bar_store.append(panel, timeframe, replace=replace and i == 0)
+            print("Synced {} bars up to {}".format(timeframe.value, last.date()))
+
+    def _covers(self, symbol: str, timeframe: Timeframe, first_day, last_day) -> bool:
+        bars = self.bar_store.read_array(symbol, timeframe)
+        if len(bars) == 0:
+            return False
+        first = pandas.Timestamp(int(bars["time"][0]), tz="UTC").tz_convert(TIMEZONE).date()
+        return first <= first_day and self.bar_store.last_timestamp(symbol, timeframe).date() >= last_day
+
+    def _download(self, symbols: List[str], limit: int, timeframe: Timeframe, replace: bool) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        metrics = Metrics.shared()
+        with metrics.span("bar_download", timeframe=timeframe.value):
+            panel = self.broker.get_bars_many(symbols, timeframe, limit=limit)
+        metrics.increment("bar_download_symbols", len(symbols), timeframe=timeframe.value)
+        self.bar_store.append(panel, timeframe, replace=replace)
+
+    def _missing_bars(self, symbol: str, timeframe: Timeframe, history: int) -> int:
+        last = self.bar_store.last_timestamp(symbol, timeframe)
+        if last is None or self.bar_store.count(symbol, timeframe) < history:
+            return history
+
+        now = pandas.Timestamp.now(tz=TIMEZONE)
+        if timeframe == Timeframe.DAY:
+            gap = len(pandas.bdate_range(last.date(), now.date()))
+        else:
+            gap = math.ceil((now - last) / BAR_DURATION[timeframe]) + 1
+        return max(1, min(history, gap))
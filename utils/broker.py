@@ -3,13 +3,21 @@ import datetime
 import time
 from enum import Enum
 from random import randint
-from typing import List
+from typing import Dict, List, Optional
 
 import alpaca_trade_api as alpaca_api
+import pandas
 from alpaca_trade_api.entity import BarSet, Position, Account
 from alpaca_trade_api.rest import APIError
 
+from utils.asset_index import AssetIndex
+from utils.market_clock import MarketClock
+from utils.market_stream import AlpacaTradeStream, PriceFeed, TradeStream
+from utils.metrics import instrumented
 from utils.notification import Notification
+from utils.portfolio_state import PortfolioState
+from utils.transport import Transport
+from utils.util import chunked
 
 
 class Timeframe(Enum):
@@ -19,6 +27,17 @@ class Timeframe(Enum):
     DAY = 'day'
 
 
+BAR_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+def bars_panel(frames: Dict[str, pandas.DataFrame]) -> pandas.DataFrame:
+    """ Stack per-symbol bar frames into a single frame indexed by (symbol, time) """
+    if not frames:
+        index = pandas.MultiIndex.from_arrays([[], []], names=["symbol", "time"])
+        return pandas.DataFrame(columns=BAR_FIELDS, index=index)
+    return pandas.concat(frames, names=["symbol", "time"]).sort_index()
+
+
 class Broker(abc.ABC):
 
     @abc.abstractmethod
@@ -29,10 +48,29 @@ class Broker(abc.ABC):
     def get_current_price(self, symbol):
         pass
 
+    @abc.abstractmethod
+    def sync_portfolio(self) -> PortfolioState:
+        """ Positions, open orders and fills kept up to date in memory """
+        pass
+
+    @abc.abstractmethod
+    def stream_prices(self, symbols: List[str]):
+        pass
+
     @abc.abstractmethod
     def get_bars(self, symbol: str, timeframe: Timeframe, limit: int):
         pass
 
+    @abc.abstractmethod
+    def get_bars_many(self, symbols: List[str], timeframe: Timeframe, limit: int):
+        pass
+
+    @abc.abstractmethod
+    def get_bars_range(self, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                       end: pandas.Timestamp, limit: int):
+        """ Bars with start <= time <= end as a (symbol, time) panel, at most `limit` per symbol """
+        pass
+
     @abc.abstractmethod
     def get_positions(self):
         pass
@@ -46,38 +84,85 @@ class Broker(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit):
+    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit, check_market_open=True):
         pass
 
     @abc.abstractmethod
-    def cancel_open_orders(self):
+    def cancel_open_orders(self, symbols: Optional[List[str]] = None):
         pass
 
     @abc.abstractmethod
-    def close_all_positions(self):
+    def close_all_positions(self, symbols: Optional[List[str]] = None):
         pass
 
     @abc.abstractmethod
     def is_tradable(self, symbol: str):
         pass
 
+    @abc.abstractmethod
+    def filter_tradable(self, symbols: List[str]):
+        pass
+
     @abc.abstractmethod
     def is_market_open(self):
         pass
 
+    @abc.abstractmethod
+    def is_trading_day(self):
+        pass
 
+    @abc.abstractmethod
+    def next_trading_day(self, after: Optional[datetime.date] = None) -> datetime.date:
+        pass
+
+
+@instrumented("broker")
 class AlpacaClient(Broker):
     MAX_RETRIES = 3
-
-    def __init__(self, notification: Notification):
-        self.api = alpaca_api.REST()
+    CLOSE_TIMEOUT = 30  # seconds to wait for cancel/fill events
+    BARSET_CHUNK_SIZE = 200  # max symbols allowed per barset request
+    BARSET_MAX_BARS = 1000  # max bars per symbol returned by a barset request
+
+    def __init__(self, notification: Notification, trade_stream: Optional[TradeStream] = None,
+                 transport: Transport = None):
+        # the REST client keeps its own session and retries on rate limits, the transport counts every call
+        self.api = (transport or Transport.shared()).wrap("alpaca", alpaca_api.REST())
         self.notification = notification
+        self.asset_index = AssetIndex(self.api)
+        self.clock = MarketClock(self.api)
+        self.trade_stream = trade_stream
+        self.price_feed = PriceFeed()
+        self.portfolio_state = PortfolioState(self.price_feed)
 
     def get_portfolio(self) -> Account:
         return self.api.get_account()
 
     def get_current_price(self, symbol) -> float:
-        return self.api.get_last_trade(symbol).price
+        # streamed price when available, REST otherwise
+        price = self.price_feed.get_price(symbol)
+        if price is None:
+            price = self.api.get_last_trade(symbol).price
+        return price
+
+    def stream_prices(self, symbols: List[str]) -> PriceFeed:
+        self._get_trade_stream().subscribe(symbols, self.price_feed.on_trade)
+        return self.price_feed
+
+    def sync_portfolio(self) -> PortfolioState:
+        """
+            Keeps positions and open orders in memory from the trade updates stream, seeded from REST once. The
+            stream is subscribed first, the updates received until the snapshot is loaded are replayed on top of it
+        """
+        self._get_trade_stream().subscribe_trade_updates(self.portfolio_state.on_trade_update)
+        as_of = pandas.Timestamp.now(tz="UTC")
+        self.portfolio_state.load(self.api.list_positions(),
+                                  [order._raw for order in self.api.list_orders(status="open", nested=True)], as_of)
+        return self.portfolio_state
+
+    def _get_trade_stream(self) -> TradeStream:
+        if self.trade_stream is None:
+            self.trade_stream = AlpacaTradeStream()
+        return self.trade_stream
 
     # TODO : get_barset has been deprecated use get_bars instead
     # alpaca.get_bars('AAPL', TimeFrame.Day, start='2021-09-12', end="2021-09-21").df
@@ -85,7 +170,25 @@ class AlpacaClient(Broker):
     def get_bars(self, symbol: str, timeframe: Timeframe, limit: int) -> BarSet:
         return self.api.get_barset(symbol, timeframe.value, limit).df[symbol]
 
+    def get_bars_many(self, symbols: List[str], timeframe: Timeframe, limit: int) -> pandas.DataFrame:
+        frames = {}
+        for chunk in chunked(symbols, AlpacaClient.BARSET_CHUNK_SIZE):
+            barset = self.api.get_barset(chunk, timeframe.value, limit)
+            frames.update({symbol: bars.df for symbol, bars in barset.items() if len(bars) > 0})
+        return bars_panel(frames)
+
+    def get_bars_range(self, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                       end: pandas.Timestamp, limit: int) -> pandas.DataFrame:
+        frames = {}
+        for chunk in chunked(symbols, AlpacaClient.BARSET_CHUNK_SIZE):
+            barset = self.api.get_barset(chunk, timeframe.value, min(limit, AlpacaClient.BARSET_MAX_BARS),
+                                         start=start.isoformat(), end=end.isoformat())
+            frames.update({symbol: bars.df for symbol, bars in barset.items() if len(bars) > 0})
+        return bars_panel(frames)
+
     def get_positions(self) -> List[Position]:
+        if self.portfolio_state.synced:
+            return self.portfolio_state.get_positions()
         return self.api.list_positions()
 
     def await_market_open(self):
@@ -95,10 +198,19 @@ class AlpacaClient(Broker):
         self._await_market(True)
 
     def is_tradable(self, symbol: str) -> bool:
-        return self.api.get_asset(symbol).tradable
+        return self.asset_index.is_tradable(symbol)
+
+    def filter_tradable(self, symbols: List[str]) -> List[str]:
+        return self.asset_index.filter_tradable(symbols)
 
     def is_market_open(self) -> bool:
-        return self.api.get_clock().is_open
+        return self.clock.is_open()
+
+    def is_trading_day(self) -> bool:
+        return self.clock.is_trading_day()
+
+    def next_trading_day(self, after: Optional[datetime.date] = None) -> datetime.date:
+        return self.clock.next_trading_day(after)
 
     def market_buy(self, symbol, qty):
         return self._place_market_order(symbol, qty, "buy")
@@ -114,9 +226,9 @@ class AlpacaClient(Broker):
         else:
             print("{} Order could not be placed ...Market is NOT open.. !".format(side))
 
-    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit):
+    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit, check_market_open=True):
         print("Placing bracket order to {}: {} shares of {} -> ".format(side, qty, symbol))
-        if self.is_market_open():
+        if not check_market_open or self.is_market_open():
             try:
                 resp = self.api.submit_order(symbol, qty, side, "market", "day",
                                              order_class="bracket",
@@ -127,56 +239,66 @@ class AlpacaClient(Broker):
                                          .format(side, qty, symbol, api_error))
             else:
                 self.notification.notify("Bracket order to {}: {} shares of {} placed".format(side, qty, symbol))
-                # return resp
+                return resp
         else:
             print("Order to {} could not be placed ...Market is NOT open.. !".format(side))
 
-    def cancel_open_orders(self):
+    def cancel_open_orders(self, symbols: Optional[List[str]] = None):
+        # all open orders, or only those of `symbols` (e.g. the symbols of one strategy)
         if self.is_market_open():
             print("Closing all open orders ...")
-            self.api.cancel_all_orders()
-            time.sleep(randint(1, 3))
+            if symbols is None:
+                self.api.cancel_all_orders()
+            else:
+                for order in self.api.list_orders(status="open"):
+                    if order.symbol in symbols:
+                        self.api.cancel_order(order.id)
+            if self.portfolio_state.synced:
+                self.portfolio_state.wait_until_no_open_orders(AlpacaClient.CLOSE_TIMEOUT, symbols)
+            else:
+                time.sleep(randint(1, 3))
 
         else:
             print("Could not cancel open orders ...Market is NOT open.. !")
 
-    def close_all_positions(self, trying=0):
-        if self.is_market_open():
-            self.cancel_open_orders()
-            self.api.close_all_positions()
+    def close_all_positions(self, symbols: Optional[List[str]] = None):
+        if not self.is_market_open():
+            print("Positions cannot be closed ...Market is NOT open.. !")
+            return
+
+        for trying in range(AlpacaClient.MAX_RETRIES + 1):
+            if trying > 0:
+                print("Closing all open positions ... Trying: {} time".format(trying))
+            self.cancel_open_orders(symbols)
+            if symbols is None:
+                self.api.close_all_positions()
+            else:
+                for position in self.get_positions():
+                    if position.symbol in symbols:
+                        self.api.close_position(position.symbol)
 
-            time.sleep(randint(3, 7))
-            if len(self.get_positions()) == 0:
+            if self._wait_until_flat(symbols):
                 print("Closed all open positions ...")
                 return
 
-            if trying < AlpacaClient.MAX_RETRIES:
-                trying = trying + 1
-                print("Closing all open positions ... Trying: {} time".format(trying))
-                self.close_all_positions(trying)
+        self.notification.notify("Could not close all positions ... ")
 
-            else:
-                self.notification.notify("Could not close all positions ... ".format(trying))
-
-        else:
-            print("Positions cannot be closed ...Market is NOT open.. !")
+    def _wait_until_flat(self, symbols: Optional[List[str]] = None) -> bool:
+        # fill events close the local positions, without the stream fall back to polling
+        if self.portfolio_state.synced:
+            return self.portfolio_state.wait_until_flat(AlpacaClient.CLOSE_TIMEOUT, symbols)
+        time.sleep(randint(3, 7))
+        return not any(symbols is None or position.symbol in symbols for position in self.api.list_positions())
 
     def _await_market(self, wait_close):
         event = "close" if wait_close else "open"
         print(f"waiting for market {event}")
 
-        clock = self.api.get_clock()
-        target_time = clock.next_close if wait_close else clock.next_open
-        target_time = target_time.replace(tzinfo=datetime.timezone.utc).timestamp()
-
-        while clock.is_open == wait_close:
-            curr_time = clock.timestamp.replace(
-                tzinfo=datetime.timezone.utc
-            ).timestamp()
-            time_to_open = (target_time - curr_time) // 60
-
-            print(f"{time_to_open} minutes until market {event}")
-            time.sleep(300)
-            clock = self.api.get_clock()
+        target_time = self.clock.next_close() if wait_close else self.clock.next_open()
+        while self.is_market_open() == wait_close:
+            seconds_to_event = (target_time - datetime.datetime.now(target_time.tzinfo)).total_seconds()
+            print(f"{seconds_to_event // 60} minutes until market {event}")
+            # wake up right at the event, the clock confirms it with the server near the boundary
+            time.sleep(min(300, max(1, seconds_to_event)))
 
         print(f"market {event}")
@@ -0,0 +1,41 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+
+
+class TokenBucket(object):
+    """ Thread-safe token bucket refilled at `rate` tokens per second, holding at most `capacity` tokens """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: int, burst: int = 10):
+        # the burst is carved out of the budget so that no 60s window exceeds requests_per_minute
+        burst = max(1, min(burst, requests_per_minute // 2))
+        return cls((requests_per_minute - burst) / 60.0, burst)
+
+    def acquire(self, tokens: int = 1) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def bounded_map(fn: Callable, items: Iterable, workers: int) -> List:
+    """ Apply fn to every item on at most `workers` threads, returning results in input order """
+    if workers <= 1:
+        return [fn(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, items))
@@ -0,0 +1,224 @@
+import itertools
+import threading
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional
+
+import pandas
+
+from utils.bar_store import TIMEZONE
+from utils.broker import Broker, Timeframe
+from utils.market_stream import PriceFeed
+from utils.portfolio_state import LocalPosition, PortfolioState
+
+
+@dataclass
+class DryRunOrder:
+    id: str
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    status: str = "filled"
+
+
+@dataclass
+class DryRunAccount:
+    portfolio_value: float
+    cash: float
+    realized_pl: float
+    unrealized_pl: float
+
+
+class _Bracket(object):
+    """ The open take profit and stop loss legs of a filled bracket order """
+    __slots__ = ("id", "symbol", "exit_side", "qty", "stop_loss", "take_profit")
+
+    def __init__(self, order_id: str, symbol: str, exit_side: str, qty: float, stop_loss: float, take_profit: float):
+        self.id = order_id
+        self.symbol = symbol
+        self.exit_side = exit_side
+        self.qty = qty
+        self.stop_loss = stop_loss
+        self.take_profit = take_profit
+
+    def exit_price(self, price: float) -> Optional[float]:
+        """ Fill price of the leg triggered by a trade at `price`, the stop first when a gap crosses both """
+        if self.exit_side == "sell":
+            if price <= self.stop_loss:
+                return price
+            if price >= self.take_profit:
+                return self.take_profit
+        else:
+            if price >= self.stop_loss:
+                return price
+            if price <= self.take_profit:
+                return self.take_profit
+        return None
+
+    def leg(self, kind: str) -> dict:
+        return {"id": "{}-{}".format(self.id, kind), "symbol": self.symbol, "side": self.exit_side, "qty": self.qty,
+                "type": "limit" if kind == "tp" else "stop"}
+
+
+class DryRunBroker(Broker):
+    """
+        Executes orders locally for dry runs (`dry_run` in the common config): market data, the calendar and tradable
+        assets come from `broker`, orders never reach it. Market orders fill at the current price, the take profit and
+        stop loss legs of a bracket are resolved against the streamed trades (or the polled prices when nothing is
+        streamed). Positions and fills go through a PortfolioState like the broker's trade updates, so fill handlers
+        such as the journal see the dry run fills.
+    """
+
+    def __init__(self, broker: Broker, initial_equity: float = 100000):
+        self.broker = broker
+        self.initial_equity = initial_equity
+        self.price_feed = PriceFeed()
+        self.portfolio_state = PortfolioState(self.price_feed)
+        # nothing is held at the start of a dry run
+        self.portfolio_state.load([], [])
+        self.lock = threading.RLock()
+        self.order_ids = itertools.count(1)
+        self.brackets: Dict[str, Dict[str, _Bracket]] = {}  # symbol -> order id -> open legs
+        self.realized_pl: Dict[str, float] = {}
+        self.order_count = 0
+
+    def sync_portfolio(self) -> PortfolioState:
+        return self.portfolio_state
+
+    def get_portfolio(self) -> DryRunAccount:
+        positions = self.portfolio_state.get_positions()
+        realized = sum(self.realized_pl.values())
+        unrealized = sum(position.unrealized_pl for position in positions)
+        invested = sum(position.market_value for position in positions)
+        equity = self.initial_equity + realized + unrealized
+        return DryRunAccount(equity, equity - invested, realized, unrealized)
+
+    def get_current_price(self, symbol) -> float:
+        price = self.price_feed.get_price(symbol)
+        if price is None:
+            price = self.broker.get_current_price(symbol)
+            # a polled price moves the open legs like a streamed trade
+            self.on_trade(symbol, price, 0, pandas.Timestamp.now(tz=TIMEZONE))
+        return price
+
+    def stream_prices(self, symbols: List[str]) -> PriceFeed:
+        price_feed = self.broker.stream_prices(symbols)
+        price_feed.add_handler(self.on_trade)
+        return price_feed
+
+    def on_trade(self, symbol: str, price: float, size: float, timestamp: pandas.Timestamp) -> None:
+        self.price_feed.on_trade(symbol, price, size, timestamp)
+        if symbol not in self.brackets:
+            return
+        with self.lock:
+            for bracket in list(self.brackets.get(symbol, {}).values()):
+                exit_price = bracket.exit_price(price)
+                if exit_price is not None:
+                    self._close_bracket(bracket, exit_price, timestamp)
+
+    def get_bars(self, symbol: str, timeframe: Timeframe, limit: int):
+        return self.broker.get_bars(symbol, timeframe, limit)
+
+    def get_bars_many(self, symbols: List[str], timeframe: Timeframe, limit: int):
+        return self.broker.get_bars_many(symbols, timeframe, limit)
+
+    def get_bars_range(self, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                       end: pandas.Timestamp, limit: int):
+        return self.broker.get_bars_range(symbols, timeframe, start, end, limit)
+
+    def get_positions(self) -> List[LocalPosition]:
+        return self.portfolio_state.get_positions()
+
+    def await_market_open(self):
+        self.broker.await_market_open()
+
+    def await_market_close(self):
+        self.broker.await_market_close()
+
+    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit, check_market_open=True):
+        if check_market_open and not self.is_market_open():
+            print("Order to {} could not be placed ...Market is NOT open.. !".format(side))
+            return None
+        if qty <= 0:
+            print("Bracket order to {}: {} shares of {} could not be placed".format(side, qty, symbol))
+            return None
+
+        price = self.get_current_price(symbol)
+        timestamp = pandas.Timestamp.now(tz=TIMEZONE)
+        with self.lock:
+            order = DryRunOrder(str(next(self.order_ids)), symbol, side, qty, price)
+            self.order_count += 1
+            self._fill(order.id, symbol, side, qty, price, timestamp)
+            bracket = _Bracket(order.id, symbol, "sell" if side == "buy" else "buy", qty, stop_loss, take_profit)
+            self.brackets.setdefault(symbol, {})[order.id] = bracket
+            for kind in ("tp", "sl"):
+                self.portfolio_state.on_trade_update("new", bracket.leg(kind), None, None, timestamp)
+        return order
+
+    def cancel_open_orders(self, symbols: Optional[List[str]] = None):
+        timestamp = pandas.Timestamp.now(tz=TIMEZONE)
+        with self.lock:
+            for symbol in list(self.brackets if symbols is None else symbols):
+                for bracket in list(self.brackets.get(symbol, {}).values()):
+                    self._cancel_bracket(bracket, timestamp)
+
+    def close_all_positions(self, symbols: Optional[List[str]] = None):
+        with self.lock:
+            self.cancel_open_orders(symbols)
+            timestamp = pandas.Timestamp.now(tz=TIMEZONE)
+            for position in self.portfolio_state.get_positions():
+                if symbols is None or position.symbol in symbols:
+                    side = "sell" if position.qty > 0 else "buy"
+                    self._fill(str(next(self.order_ids)), position.symbol, side, abs(position.qty),
+                               self.get_current_price(position.symbol), timestamp)
+        print("Closed all open positions ...")
+
+    def is_tradable(self, symbol: str) -> bool:
+        return self.broker.is_tradable(symbol)
+
+    def filter_tradable(self, symbols: List[str]) -> List[str]:
+        return self.broker.filter_tradable(symbols)
+
+    def is_market_open(self) -> bool:
+        return self.broker.is_market_open()
+
+    def is_trading_day(self) -> bool:
+        return self.broker.is_trading_day()
+
+    def next_trading_day(self, after: Optional[date] = None) -> date:
+        return self.broker.next_trading_day(after)
+
+    def report(self) -> str:
+        account = self.get_portfolio()
+        return "Dry run: {} orders, {} open positions, realized P/L ${:.2f}, unrealized P/L ${:.2f}" \
+            .format(self.order_count, len(self.portfolio_state.positions), account.realized_pl, account.unrealized_pl)
+
+    def _close_bracket(self, bracket: _Bracket, price: float, timestamp: pandas.Timestamp) -> None:
+        filled, canceled = ("tp", "sl") if price == bracket.take_profit else ("sl", "tp")
+        self._remove_bracket(bracket)
+        self.portfolio_state.on_trade_update("canceled", bracket.leg(canceled), None, None, timestamp)
+        self._fill(bracket.leg(filled)["id"], bracket.symbol, bracket.exit_side, bracket.qty, price, timestamp)
+
+    def _cancel_bracket(self, bracket: _Bracket, timestamp: pandas.Timestamp) -> None:
+        self._remove_bracket(bracket)
+        for kind in ("tp", "sl"):
+            self.portfolio_state.on_trade_update("canceled", bracket.leg(kind), None, None, timestamp)
+
+    def _remove_bracket(self, bracket: _Bracket) -> None:
+        open_brackets = self.brackets[bracket.symbol]
+        del open_brackets[bracket.id]
+        if not open_brackets:
+            del self.brackets[bracket.symbol]
+
+    def _fill(self, order_id: str, symbol: str, side: str, qty: float, price: float,
+              timestamp: pandas.Timestamp) -> None:
+        # realized P/L of the part of the position the fill closes, before the portfolio state applies it
+        position = self.portfolio_state.positions.get(symbol)
+        signed_qty = qty if side == "buy" else -qty
+        if position is not None and position.qty * signed_qty < 0:
+            closed = min(abs(signed_qty), abs(position.qty))
+            pnl = (price - position.avg_entry_price) * closed * (1 if position.qty > 0 else -1)
+            self.realized_pl[symbol] = self.realized_pl.get(symbol, 0.0) + pnl
+        order = {"id": order_id, "symbol": symbol, "side": side, "qty": qty}
+        self.portfolio_state.on_trade_update("fill", order, price, qty, timestamp)
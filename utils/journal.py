@@ -0,0 +1,263 @@
+import abc
+import copy
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import pandas
+from peewee import (BooleanField, CharField, DatabaseProxy, DateField, DateTimeField, FloatField, Model,
+                    SqliteDatabase, chunked)
+
+from utils.portfolio_state import Fill
+
+if TYPE_CHECKING:
+    from utils.order_executor import OrderSignal
+
+database = DatabaseProxy()
+
+
+class JournalModel(Model):
+    class Meta:
+        database = database
+
+
+class Run(JournalModel):
+    run_id = CharField(primary_key=True)
+    strategy = CharField()
+    dry_run = BooleanField()
+    started_at = DateTimeField()
+    finished_at = DateTimeField(null=True)
+
+
+class Pick(JournalModel):
+    run_id = CharField(index=True)
+    strategy = CharField(default="")
+    date = DateField()
+    symbol = CharField()
+    yesterdays_change = FloatField()
+    moved = FloatField()
+    weightage = FloatField()
+    lw_lower_bound = FloatField()
+    lw_upper_bound = FloatField()
+    step = FloatField()
+
+    class Meta:
+        indexes = ((("symbol", "date"), False), (("date",), False))
+
+
+class Signal(JournalModel):
+    run_id = CharField(index=True)
+    strategy = CharField(default="")
+    date = DateField()
+    time = DateTimeField()
+    symbol = CharField()
+    side = CharField()
+    qty = FloatField()
+    price = FloatField(null=True)
+    stop_loss = FloatField()
+    take_profit = FloatField()
+
+    class Meta:
+        indexes = ((("symbol", "date"), False), (("date",), False))
+
+
+class Order(JournalModel):
+    run_id = CharField(index=True)
+    strategy = CharField(default="")
+    date = DateField()
+    time = DateTimeField()
+    order_id = CharField(null=True)
+    symbol = CharField()
+    side = CharField()
+    qty = FloatField()
+    stop_loss = FloatField()
+    take_profit = FloatField()
+    status = CharField()
+
+    class Meta:
+        indexes = ((("symbol", "date"), False), (("date",), False))
+
+
+class FillRecord(JournalModel):
+    run_id = CharField(index=True)
+    date = DateField()
+    time = DateTimeField()
+    order_id = CharField()
+    symbol = CharField()
+    side = CharField()
+    qty = FloatField()
+    price = FloatField()
+
+    class Meta:
+        table_name = "fill"
+        indexes = ((("symbol", "date"), False), (("date",), False))
+
+
+TABLES = [Run, Pick, Signal, Order, FillRecord]
+
+
+class Journal(object):
+    """ Record of a run: the day's picks, the signals, the orders sent for them and their fills """
+
+    @abc.abstractmethod
+    def start_run(self, strategy: str, dry_run: bool):
+        pass
+
+    def for_strategy(self, strategy: str) -> "Journal":
+        """ The journal of one strategy of the run, its picks, signals and orders are attributed to it """
+        return self
+
+    @abc.abstractmethod
+    def record_picks(self, picks: List, day: date):
+        pass
+
+    @abc.abstractmethod
+    def record_signal(self, signal: "OrderSignal", price: Optional[float]):
+        pass
+
+    @abc.abstractmethod
+    def record_order(self, signal: "OrderSignal", order_id: Optional[str], status: str):
+        pass
+
+    @abc.abstractmethod
+    def record_fill(self, fill: Fill):
+        pass
+
+    def close(self):
+        pass
+
+
+class NoOpJournal(Journal):
+    def start_run(self, strategy: str, dry_run: bool):
+        pass
+
+    def record_picks(self, picks: List, day: date):
+        pass
+
+    def record_signal(self, signal: "OrderSignal", price: Optional[float]):
+        pass
+
+    def record_order(self, signal: "OrderSignal", order_id: Optional[str], status: str):
+        pass
+
+    def record_fill(self, fill: Fill):
+        pass
+
+
+class SqliteJournal(Journal):
+    """
+        Journal kept in SQLite (WAL mode, so the backtester can read while a run writes). Records are queued and
+        written by a background thread in batches of up to BATCH_SIZE rows, one transaction per batch, so that a
+        strategy tick never waits on the disk.
+    """
+    FOLDER = "data"
+    BATCH_SIZE = 500
+    ROWS_PER_INSERT = 50  # keeps a multi-row insert under SQLite's bound variable limit
+    FLUSH_SECONDS = 1
+    _CLOSE = object()
+
+    def __init__(self, db_name: str, run_id: str, folder: str = FOLDER):
+        os.makedirs(folder, exist_ok=True)
+        self.db = SqliteDatabase(os.path.join(folder, db_name), pragmas={
+            "journal_mode": "wal",
+            "synchronous": "normal",  # durable enough in WAL mode, without a fsync per transaction
+            "foreign_keys": 0,
+        })
+        database.initialize(self.db)
+        with self.db.connection_context():
+            self.db.create_tables(TABLES)
+
+        self.run_id = run_id
+        self.strategy = ""
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self.thread.start()
+
+    def start_run(self, strategy: str, dry_run: bool):
+        self._put(Run, {"run_id": self.run_id, "strategy": strategy, "dry_run": dry_run,
+                        "started_at": datetime.now()})
+
+    def for_strategy(self, strategy: str) -> "SqliteJournal":
+        # a view sharing the queue and the writer
+        journal = copy.copy(self)
+        journal.strategy = strategy
+        return journal
+
+    def record_picks(self, picks: List, day: date):
+        for pick in picks:
+            self._put(Pick, dict(vars(pick), run_id=self.run_id, date=day))
+
+    def record_signal(self, signal: "OrderSignal", price: Optional[float]):
+        self._put(Signal, dict(vars(signal), run_id=self.run_id, price=price, **self._now()))
+
+    def record_order(self, signal: "OrderSignal", order_id: Optional[str], status: str):
+        self._put(Order, dict(vars(signal), run_id=self.run_id, order_id=order_id, status=status, **self._now()))
+
+    def record_fill(self, fill: Fill):
+        timestamp = pandas.Timestamp(fill.timestamp).to_pydatetime()
+        if timestamp.tzinfo is not None:
+            # stream timestamps are UTC, the journal keeps local times like the other records
+            timestamp = timestamp.astimezone().replace(tzinfo=None)
+        self._put(FillRecord, {"run_id": self.run_id, "date": timestamp.date(), "time": timestamp,
+                               "order_id": fill.order_id, "symbol": fill.symbol, "side": fill.side, "qty": fill.qty,
+                               "price": fill.price})
+
+    def close(self, timeout: float = 30):
+        """ Writes the pending records, marks the run finished and stops the background thread """
+        self.queue.put(SqliteJournal._CLOSE)
+        self.thread.join(timeout)
+
+    def read(self, model, start: date, end: date, symbols: Optional[List[str]] = None) -> pandas.DataFrame:
+        """ Rows of a journal table between two dates (inclusive), e.g. the live orders to compare with a backtest """
+        query = model.select().where(model.date.between(start, end))
+        if symbols is not None:
+            query = query.where(model.symbol.in_(symbols))
+        with self.db.connection_context():
+            return pandas.DataFrame(list(query.dicts()))
+
+    def _put(self, model, row: dict):
+        if "strategy" in model._meta.fields:
+            row.setdefault("strategy", self.strategy)
+        self.queue.put((model, row))
+
+    def _run(self):
+        closing = False
+        while not closing:
+            records = [self.queue.get()]
+            deadline = time.monotonic() + SqliteJournal.FLUSH_SECONDS
+            while (records[-1] is not SqliteJournal._CLOSE and len(records) < SqliteJournal.BATCH_SIZE
+                   and time.monotonic() < deadline):
+                try:
+                    records.append(self.queue.get(timeout=deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if records[-1] is SqliteJournal._CLOSE:
+                closing = True
+                records.pop()
+            self._write(records, finished=closing)
+
+    def _write(self, records: List[Tuple], finished: bool = False):
+        rows: Dict[type, List[dict]] = defaultdict(list)
+        for model, row in records:
+            rows[model].append(row)
+
+        # a failed batch is reported and dropped, the journal must not take the trading loop down
+        try:
+            with self.db.connection_context(), self.db.atomic():
+                for model, model_rows in rows.items():
+                    for batch in chunked(model_rows, SqliteJournal.ROWS_PER_INSERT):
+                        model.insert_many(batch).execute()
+                if finished:
+                    Run.update(finished_at=datetime.now()).where(Run.run_id == self.run_id).execute()
+        except Exception as ex:
+            print("Could not write {} journal records: {}".format(len(records), ex))
+
+    @staticmethod
+    def _now() -> dict:
+        now = datetime.now()
+        return {"date": now.date(), "time": now}
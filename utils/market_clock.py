@@ -0,0 +1,78 @@
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from alpaca_trade_api import REST
+
+TIMEZONE = ZoneInfo("America/New_York")
+
+
+class MarketClock(object):
+    """
+        Market hours computed locally from the broker calendar, which is fetched once per day. The server clock is
+        only asked within BOUNDARY of an open or close (early closes, halts, clock skew), and cached for SERVER_TTL.
+    """
+    CALENDAR_DAYS = 14
+    BOUNDARY = timedelta(minutes=2)
+    SERVER_TTL = 15  # seconds
+
+    def __init__(self, api: REST):
+        self.api = api
+        self.lock = threading.Lock()
+        self._sessions: List[Tuple[datetime, datetime]] = []
+        self._loaded_on: Optional[date] = None
+        self._server_open: Optional[bool] = None
+        self._server_checked = 0.0
+
+    def is_open(self) -> bool:
+        now = self._now()
+        session = self._session_on(now.date())
+        if session is None:
+            return False
+
+        market_open, market_close = session
+        if abs(now - market_open) < MarketClock.BOUNDARY or abs(now - market_close) < MarketClock.BOUNDARY:
+            return self._ask_server()
+        return market_open <= now < market_close
+
+    def is_trading_day(self, day: Optional[date] = None) -> bool:
+        return self._session_on(day or self._now().date()) is not None
+
+    def next_trading_day(self, after: Optional[date] = None) -> date:
+        after = after or self._now().date()
+        return next(market_open.date() for market_open, _ in self._get_sessions() if market_open.date() > after)
+
+    def next_open(self) -> datetime:
+        now = self._now()
+        return next(market_open for market_open, _ in self._get_sessions() if market_open > now)
+
+    def next_close(self) -> datetime:
+        now = self._now()
+        return next(market_close for _, market_close in self._get_sessions() if market_close > now)
+
+    def _session_on(self, day: date) -> Optional[Tuple[datetime, datetime]]:
+        return next((session for session in self._get_sessions() if session[0].date() == day), None)
+
+    def _get_sessions(self) -> List[Tuple[datetime, datetime]]:
+        with self.lock:
+            today = self._now().date()
+            if self._loaded_on != today:
+                calendar = self.api.get_calendar(start=today.isoformat(),
+                                                  end=(today + timedelta(days=MarketClock.CALENDAR_DAYS)).isoformat())
+                self._sessions = [(datetime.combine(day.date.date(), day.open, TIMEZONE),
+                                   datetime.combine(day.date.date(), day.close, TIMEZONE)) for day in calendar]
+                self._loaded_on = today
+            return self._sessions
+
+    def _ask_server(self) -> bool:
+        with self.lock:
+            if self._server_open is None or time.monotonic() - self._server_checked > MarketClock.SERVER_TTL:
+                self._server_open = self.api.get_clock().is_open
+                self._server_checked = time.monotonic()
+            return self._server_open
+
+    @staticmethod
+    def _now() -> datetime:
+        return datetime.now(TIMEZONE)
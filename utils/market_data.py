@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+import pandas
+
+from schedules.watchlist import WatchList
+from strategies.strategy import Strategy
+from utils.bar_store import BarStore
+from utils.bar_sync import BarSync
+from utils.broker import Broker, Timeframe
+from utils.concurrency import TokenBucket
+from utils.market_stream import PriceFeed
+from utils.util import load_app_variables
+
+
+class MarketData(object):
+    """
+        Universe, bars and prices shared read-only by the strategies of a run. Bars are synced into the bar store
+        once per day and timeframe for the union of the symbols the strategies ask for, the streamed symbols are the
+        union of their subscriptions and polled prices are shared for PRICE_TTL seconds, so that a second strategy
+        costs its own compute but no second round of requests.
+    """
+    PRICE_TTL = 5  # seconds
+
+    def __init__(self, broker: Broker, watchlist: Optional[WatchList] = None, bar_store: Optional[BarStore] = None,
+                 workers: int = 1, rate_limiter: Optional[TokenBucket] = None):
+        self.broker = broker
+        self.watchlist = watchlist or WatchList()
+        self.bar_store = bar_store or Strategy.get_bar_store()
+        self.bar_sync = BarSync(broker, self.bar_store, workers, rate_limiter)
+        self.lock = threading.Lock()
+        self.synced: Dict[Tuple[Timeframe, date], Dict[str, int]] = {}  # symbol -> bars synced
+        # symbol -> (set when done, bars) of the syncs running, so concurrent requests wait instead of re-downloading
+        self.in_flight: Dict[Tuple[Timeframe, date], Dict[str, Tuple[threading.Event, int]]] = {}
+        self.streamed: Set[str] = set()
+        self.prices: Dict[str, Tuple[float, float]] = {}
+
+    @classmethod
+    def from_config(cls, broker: Broker) -> "MarketData":
+        # the request budget is per API key, i.e. shared by all the strategies
+        config = load_app_variables("common") or {}
+        return cls(broker, workers=config.get("scan_workers", 1),
+                   rate_limiter=TokenBucket.per_minute(config.get("requests_per_minute", 200)))
+
+    def reset(self) -> None:
+        """ Forgets the streamed symbols, polled prices and synced symbols of the previous days """
+        with self.lock:
+            self.synced = {key: synced for key, synced in self.synced.items() if key[1] == date.today()}
+            self.streamed = set()
+            self.prices = {}
+
+    def expire_bars(self) -> None:
+        """ Bars synced today are synced again on their next request, e.g. after the close when the day bar is final """
+        with self.lock:
+            self.synced = {}
+
+    def get_universe(self, min_price: Optional[float] = None, max_price: Optional[float] = None) -> List[str]:
+        return self.watchlist.get_universe(min_price, max_price)
+
+    def get_bars(self, symbols: List[str], timeframe: Timeframe, history: int) -> pandas.DataFrame:
+        """
+            Panel of the last `history` bars of the symbols, syncing only those no strategy synced today. The download
+            runs outside the lock, symbols another strategy is downloading are waited for, and synced here if its
+            download failed
+        """
+        key = (timeframe, date.today())
+        while True:
+            done = threading.Event()
+            missing, waits = self._claim(key, symbols, history, done)
+            if missing:
+                try:
+                    self.bar_sync.sync(missing, timeframe, history)
+                    with self.lock:
+                        self.synced.setdefault(key, {}).update({symbol: history for symbol in missing})
+                finally:
+                    with self.lock:
+                        in_flight = self.in_flight[key]
+                        for symbol in missing:
+                            if in_flight.get(symbol, (None, 0))[0] is done:
+                                del in_flight[symbol]
+                    done.set()
+            if not waits:
+                return self.bar_store.tail(symbols, timeframe, history)
+            for event in waits:
+                event.wait()
+
+    def _claim(self, key: Tuple[Timeframe, date], symbols: List[str], history: int,
+               done: threading.Event) -> Tuple[List[str], Set[threading.Event]]:
+        # the symbols to download, marked in flight, and the downloads of the others to wait for
+        with self.lock:
+            synced = self.synced.setdefault(key, {})
+            in_flight = self.in_flight.setdefault(key, {})
+            missing, waits = [], set()
+            for symbol in symbols:
+                if synced.get(symbol, 0) >= history:
+                    continue
+                pending = in_flight.get(symbol)
+                if pending is not None and pending[1] >= history:
+                    waits.add(pending[0])
+                else:
+                    missing.append(symbol)
+                    in_flight[symbol] = (done, history)
+            return missing, waits
+
+    def stream_prices(self, symbols: List[str]) -> PriceFeed:
+        with self.lock:
+            self.streamed.update(symbols)
+            return self.broker.stream_prices(sorted(self.streamed))
+
+    def get_current_price(self, symbol: str) -> float:
+        price, fetched = self.prices.get(symbol, (None, 0.0))
+        if price is None or time.monotonic() - fetched > MarketData.PRICE_TTL:
+            price = self.broker.get_current_price(symbol)
+            self.prices[symbol] = (price, time.monotonic())
+        return price
@@ -0,0 +1,140 @@
+import abc
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas
+from alpaca_trade_api.stream import Stream
+
+# handler(symbol, price, size, timestamp)
+TradeHandler = Callable[[str, float, float, pandas.Timestamp], None]
+# handler(event, order, fill price, quantity filled so far on the order, timestamp), price and qty only set on fills
+TradeUpdateHandler = Callable[[str, dict, Optional[float], Optional[float], pandas.Timestamp], None]
+
+
+class PriceFeed(object):
+    """ In-memory last trade price table, kept current by a trade stream. Handlers are called on every trade """
+
+    def __init__(self, max_age: float = 60):
+        self.max_age = max_age  # seconds after which a price is considered stale
+        self.prices: Dict[str, Tuple[float, float]] = {}
+        self.handlers: List[TradeHandler] = []
+
+    def add_handler(self, handler: TradeHandler) -> None:
+        if handler not in self.handlers:
+            self.handlers.append(handler)
+
+    def get_price(self, symbol: str) -> Optional[float]:
+        price, received = self.prices.get(symbol, (None, 0))
+        if price is None or time.monotonic() - received > self.max_age:
+            return None
+        return price
+
+    def on_trade(self, symbol: str, price: float, size: float, timestamp: pandas.Timestamp) -> None:
+        self.prices[symbol] = (price, time.monotonic())
+        for handler in self.handlers:
+            handler(symbol, price, size, timestamp)
+
+
+class TradeStream(abc.ABC):
+
+    @abc.abstractmethod
+    def subscribe(self, symbols: List[str], handler: TradeHandler):
+        pass
+
+    @abc.abstractmethod
+    def subscribe_trade_updates(self, handler: TradeUpdateHandler):
+        pass
+
+    @abc.abstractmethod
+    def stop(self):
+        pass
+
+
+class AlpacaTradeStream(TradeStream):
+    """
+        Alpaca market data and trade updates websockets, run on a background thread. Subscribing replaces the symbols
+        streamed.
+    """
+
+    def __init__(self):
+        self.stream = Stream()
+        self.symbols: List[str] = []
+        self.handler: Optional[TradeHandler] = None
+        self.update_handler: Optional[TradeUpdateHandler] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def subscribe(self, symbols: List[str], handler: TradeHandler):
+        self.handler = handler
+        stale = [symbol for symbol in self.symbols if symbol not in symbols]
+        if stale:
+            self.stream.unsubscribe_trades(*stale)
+        self.symbols = list(symbols)
+        self.stream.subscribe_trades(self._on_trade, *self.symbols)
+        self._start()
+        print("Streaming trades for {} symbols".format(len(self.symbols)))
+
+    def subscribe_trade_updates(self, handler: TradeUpdateHandler):
+        self.update_handler = handler
+        self.stream.subscribe_trade_updates(self._on_trade_update)
+        self._start()
+
+    def stop(self):
+        self.stream.stop()
+
+    def _start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.stream.run, name="alpaca-stream", daemon=True)
+            self.thread.start()
+
+    async def _on_trade(self, trade):
+        self.handler(trade.symbol, float(trade.price), float(trade.size), trade.timestamp)
+
+    async def _on_trade_update(self, update):
+        # the order's filled_qty is cumulative on every fill event, the entity leaves the timestamp a string
+        price, qty = getattr(update, "price", None), update.order.get("filled_qty", getattr(update, "qty", None))
+        timestamp = getattr(update, "timestamp", None)
+        self.update_handler(update.event, update.order, None if price is None else float(price),
+                            None if qty is None else float(qty),
+                            pandas.Timestamp(timestamp) if timestamp else pandas.Timestamp.now(tz="UTC"))
+
+
+class ReplayTradeStream(TradeStream):
+    """
+        In-process stream replaying recorded (symbol, price, size, timestamp) trades, with trade updates pushed by the
+        caller, for tests and offline runs.
+    """
+
+    def __init__(self, trades: Iterable[Tuple[str, float, float, pandas.Timestamp]] = ()):
+        self.trades = list(trades)
+        self.symbols = set()
+        self.handler: Optional[TradeHandler] = None
+        self.update_handler: Optional[TradeUpdateHandler] = None
+
+    def subscribe(self, symbols: List[str], handler: TradeHandler):
+        self.symbols = set(symbols)
+        self.handler = handler
+
+    def subscribe_trade_updates(self, handler: TradeUpdateHandler):
+        self.update_handler = handler
+
+    def stop(self):
+        self.handler = None
+        self.update_handler = None
+
+    def push_trade(self, symbol: str, price: float, size: float = 100,
+                   timestamp: Optional[pandas.Timestamp] = None) -> None:
+        if self.handler is not None and symbol in self.symbols:
+            self.handler(symbol, price, size, timestamp or pandas.Timestamp.now(tz="UTC"))
+
+    def push_trade_update(self, event: str, order: dict, price: Optional[float] = None, qty: Optional[float] = None,
+                          timestamp: Optional[pandas.Timestamp] = None) -> None:
+        if self.update_handler is not None:
+            self.update_handler(event, order, price, qty, timestamp or pandas.Timestamp.now(tz="UTC"))
+
+    def replay(self) -> None:
+        for symbol, price, size, timestamp in self.trades:
+            if self.handler is None:
+                return
+            if symbol in self.symbols:
+                self.handler(symbol, price, size, timestamp)
@@ -0,0 +1,171 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# histogram upper bounds in seconds, the last bucket is +Inf
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Histogram(object):
+    """ Fixed bucket histogram, observing is a bisect and a few additions """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """ Upper bound of the bucket holding the q-quantile, the max for the +Inf bucket """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics(object):
+    """
+        In-process spans, counters and histograms. span() times a block into the histogram of its name, labels tell
+        apart e.g. the broker calls. summary() is the per-run report, to_prometheus() its Prometheus text format.
+    """
+    PREFIX = "vyapari_"
+    _shared: Optional["Metrics"] = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[Key, float] = {}
+        self.histograms: Dict[Key, Histogram] = {}
+
+    @classmethod
+    def shared(cls) -> "Metrics":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def summary(self, run_id: str) -> str:
+        with self.lock:
+            lines = ["Run {} performance".format(run_id),
+                     "{:<50} {:>7} {:>9} {:>9} {:>9} {:>9}".format("span", "count", "mean ms", "p50 ms", "p95 ms",
+                                                                  "max ms")]
+            for key, histogram in sorted(self.histograms.items()):
+                lines.append("{:<50} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(
+                    self._name(key), histogram.count, histogram.mean * 1000, histogram.quantile(0.5) * 1000,
+                    histogram.quantile(0.95) * 1000, histogram.max * 1000))
+            if self.counters:
+                lines.append("{:<50} {:>7}".format("counter", "value"))
+                lines.extend("{:<50} {:>7g}".format(self._name(key), value)
+                             for key, value in sorted(self.counters.items()))
+        return "\n".join(lines)
+
+    def to_prometheus(self, run_id: str) -> str:
+        with self.lock:
+            lines = []
+            for name in sorted({key[0] for key in self.counters}):
+                lines.append("# TYPE {}{}_total counter".format(Metrics.PREFIX, name))
+                for key, value in sorted(self.counters.items()):
+                    if key[0] == name:
+                        lines.append("{}{}_total{} {}".format(Metrics.PREFIX, name,
+                                                              self._labels(key, run_id), value))
+
+            for name in sorted({key[0] for key in self.histograms}):
+                metric = "{}{}_seconds".format(Metrics.PREFIX, name)
+                lines.append("# TYPE {} histogram".format(metric))
+                for key, histogram in sorted(self.histograms.items()):
+                    if key[0] != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append("{}_bucket{} {}".format(metric, self._labels(key, run_id, le=bound),
+                                                             cumulative))
+                    lines.append("{}_sum{} {}".format(metric, self._labels(key, run_id), histogram.sum))
+                    lines.append("{}_count{} {}".format(metric, self._labels(key, run_id), histogram.count))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str, run_id: str) -> None:
+        """ Writes the Prometheus text format atomically, e.g. for the node exporter textfile collector """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            f.write(self.to_prometheus(run_id))
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> Key:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def _name(key: Key) -> str:
+        name, labels = key
+        return name if not labels else "{}[{}]".format(name, ",".join(value for _, value in labels))
+
+    @staticmethod
+    def _labels(key: Key, run_id: str, **extra) -> str:
+        labels: List[Tuple[str, str]] = [("run_id", run_id)] + list(key[1]) + [(k, str(v)) for k, v in extra.items()]
+        return "{" + ",".join('{}="{}"'.format(k, v) for k, v in labels) + "}"
+
+
+def instrumented(name: str, metrics: Optional[Metrics] = None) -> Callable:
+    """ Class decorator recording every public method call as a `name` span labelled with the method """
+    def decorator(cls):
+        for attribute, value in list(vars(cls).items()):
+            if inspect.isfunction(value) and not attribute.startswith("_"):
+                setattr(cls, attribute, _timed_method(value, name, attribute, metrics))
+        return cls
+    return decorator
+
+
+def _timed_method(func: Callable, name: str, method: str, metrics: Optional[Metrics]) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # the shared registry is looked up per call, so that a reset or replaced registry is honoured
+        with (metrics or Metrics.shared()).span(name, call=method):
+            return func(*args, **kwargs)
+    return wrapper
@@ -1,17 +1,29 @@
 import abc
 import json
 import os
+import queue
+import threading
 import time
+from typing import List
 
 import requests
 from colorama import Fore, Style
 
+from utils.transport import Transport
+
+
+class NotificationError(Exception):
+    pass
+
 
 class Notification(object):
     @abc.abstractmethod
     def notify(self, message):
         pass
 
+    def close(self):
+        pass
+
 
 class NoOpNotification(Notification):
     def notify(self, message):
@@ -19,28 +31,85 @@ class NoOpNotification(Notification):
 
 
 class Pushover(Notification):
-    def __init__(self):
+    URL = "https://api.pushover.net/1/messages.json"
+    MAX_LENGTH = 1024
+
+    def __init__(self, transport: Transport = None):
         self.userkey = os.environ.get('PUSHOVER_API_KEY')
         self.token = os.environ.get('PUSHOVER_API_TOKEN')
-        self.retry = 3
+        self.transport = transport or Transport.shared()
 
-    def notify(self, message, trying=1):
-        print("Notifying: {}".format(message))
+    def notify(self, message):
         try:
-            res = requests.post("https://api.pushover.net/1/messages.json", data={
+            res = self.transport.post("pushover", Pushover.URL, data={
                 "token": self.token,
                 "user": self.userkey,
                 "message": message
             })
-        except ConnectionError:
-            print(f"{Fore.RED}WARNING: Message not sent.{message}{Style.RESET_ALL}\n")
-            return
+        except requests.RequestException as ex:
+            raise NotificationError(ex)
 
-        response = json.loads(res.text)
+        try:
+            response = json.loads(res.text)
+        except ValueError:
+            raise NotificationError("{}: {}".format(res.status_code, res.text))
         if response['status'] != 1:
-            if trying < self.retry:
-                time.sleep(10)
-                print("Retrying again ({}) in 10 seconds".format(trying))
-                self.notify(message, trying=trying + 1)
+            raise NotificationError(response)
+
+
+class NotificationQueue(Notification):
+    """
+        Sends notifications from a background thread so that notify() never blocks the caller. Messages arriving
+        within COALESCE_SECONDS of each other are sent as one digest.
+    """
+    COALESCE_SECONDS = 2
+    _CLOSE = object()
+
+    def __init__(self, notification: Notification, max_length: int = Pushover.MAX_LENGTH):
+        self.notification = notification
+        self.max_length = max_length
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="notification-queue", daemon=True)
+        self.thread.start()
+
+    def notify(self, message):
+        print("Notifying: {}".format(message))
+        self.queue.put(str(message))
+
+    def close(self, timeout: float = 30):
+        """ Sends the pending messages and stops the background thread """
+        self.queue.put(NotificationQueue._CLOSE)
+        self.thread.join(timeout)
+
+    def _run(self):
+        closing = False
+        while not closing:
+            messages = [self.queue.get()]
+            deadline = time.monotonic() + NotificationQueue.COALESCE_SECONDS
+            while messages[-1] is not NotificationQueue._CLOSE and time.monotonic() < deadline:
+                try:
+                    messages.append(self.queue.get(timeout=deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if messages[-1] is NotificationQueue._CLOSE:
+                closing = True
+                messages.pop()
+            for digest in self._digests(messages):
+                self._send(digest)
+
+    def _digests(self, messages: List[str]) -> List[str]:
+        digests = []
+        for message in messages:
+            if digests and len(digests[-1]) + len(message) + 1 <= self.max_length:
+                digests[-1] = digests[-1] + "\n" + message
             else:
-                print(f"{Fore.RED}WARNING: Message not sent.{message}{Style.RESET_ALL}\n")
+                digests.append(message[:self.max_length])
+        return digests
+
+    def _send(self, message: str):
+        # retries happen in the transport
+        try:
+            self.notification.notify(message)
+        except NotificationError as ex:
+            print(f"{Fore.RED}WARNING: Message not sent ({ex}).{message}{Style.RESET_ALL}\n")
@@ -0,0 +1,83 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Set, Tuple
+
+from utils.broker import Broker
+from utils.journal import Journal, NoOpJournal
+from utils.metrics import Metrics
+
+
+@dataclass
+class OrderSignal:
+    symbol: str
+    side: str
+    qty: int
+    stop_loss: float
+    take_profit: float
+
+
+class OrderExecutor(object):
+    """
+        Submits the bracket orders signalled in a tick together: the market clock is checked once for the batch and
+        the orders are sent concurrently, with at most `max_in_flight` requests outstanding.
+    """
+
+    def __init__(self, broker: Broker, max_in_flight: int = 8, journal: Optional[Journal] = None):
+        self.broker = broker
+        self.journal = journal or NoOpJournal()
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="order")
+        self.lock = threading.Lock()
+        self.pending: Set[Future] = set()
+
+    def submit(self, signals: List[OrderSignal], wait: bool = True, check_market_open: bool = True) -> List[Future]:
+        if not signals:
+            return []
+        if check_market_open and not self.broker.is_market_open():
+            print("{} orders could not be placed ...Market is NOT open.. !".format(len(signals)))
+            return []
+
+        futures = [self.pool.submit(self._place, signal) for signal in signals]
+        with self.lock:
+            self.pending.update(futures)
+        for future in futures:
+            future.add_done_callback(self._done)
+        if wait:
+            self._report([future.result() for future in futures])
+        else:
+            for future in futures:
+                future.add_done_callback(lambda done: self._report([done.result()]))
+        return futures
+
+    def drain(self) -> None:
+        """ Waits for the orders still being placed, e.g. before the positions are closed out """
+        with self.lock:
+            pending = list(self.pending)
+        for future in pending:
+            try:
+                future.result()
+            except Exception as ex:
+                print("Order failed: {!r}".format(ex))
+
+    def _done(self, future: Future) -> None:
+        with self.lock:
+            self.pending.discard(future)
+
+    def _place(self, signal: OrderSignal) -> Tuple[OrderSignal, float]:
+        start = time.perf_counter()
+        order = self.broker.place_bracket_order(signal.symbol, signal.side, signal.qty, signal.stop_loss,
+                                                signal.take_profit, check_market_open=False)
+        seconds = time.perf_counter() - start
+        Metrics.shared().observe("order_submit", seconds)
+        Metrics.shared().increment("orders", status="placed" if order is not None else "not placed")
+        if order is None:
+            self.journal.record_order(signal, None, "not placed")
+        else:
+            self.journal.record_order(signal, order.id, order.status)
+        return signal, seconds
+
+    @staticmethod
+    def _report(submitted: List[Tuple[OrderSignal, float]]) -> None:
+        for signal, seconds in submitted:
+            print("Submitted {} {} x {} in {:.0f}ms".format(signal.side, signal.qty, signal.symbol, seconds * 1000))
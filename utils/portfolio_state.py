@@ -0,0 +1,174 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas
+
+from utils.market_stream import PriceFeed
+
+OPEN_EVENTS = {"new", "pending_new", "accepted", "partial_fill", "replaced", "pending_cancel", "pending_replace"}
+DONE_EVENTS = {"fill", "canceled", "expired", "rejected", "done_for_day", "stopped", "suspended"}
+
+
+@dataclass
+class LocalPosition:
+    """ Mirrors the fields of an Alpaca Position that the strategies and schedules read """
+    symbol: str
+    qty: float  # negative when short
+    avg_entry_price: float
+    current_price: float
+
+    @property
+    def side(self) -> str:
+        return "long" if self.qty > 0 else "short"
+
+    @property
+    def market_value(self) -> float:
+        return self.qty * self.current_price
+
+    @property
+    def unrealized_pl(self) -> float:
+        return (self.current_price - self.avg_entry_price) * self.qty
+
+    @property
+    def unrealized_plpc(self) -> float:
+        return self.unrealized_pl / abs(self.avg_entry_price * self.qty) if self.qty else 0.0
+
+
+@dataclass
+class Fill:
+    order_id: str
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    timestamp: pandas.Timestamp
+
+
+class PortfolioState(object):
+    """
+        Positions, open orders and fills kept in memory from the broker's trade update events, so that readers don't
+        poll the REST API. Current prices come from the price feed, falling back to the last fill. Updates received
+        before the REST snapshot is loaded are buffered and replayed on top of it.
+    """
+
+    def __init__(self, price_feed: Optional[PriceFeed] = None):
+        self.price_feed = price_feed
+        self.changed = threading.Condition()
+        self.positions: Dict[str, LocalPosition] = {}
+        self.open_orders: Dict[str, dict] = {}
+        self.filled_qty: Dict[str, float] = {}  # order id -> quantity filled so far, repeated updates add nothing
+        self.buffered: List[Tuple] = []
+        self.fills: List[Fill] = []
+        self.fill_handlers: List[Callable[[Fill], None]] = []
+        self.synced = False
+
+    def add_fill_handler(self, handler: Callable[[Fill], None]) -> None:
+        if handler not in self.fill_handlers:
+            self.fill_handlers.append(handler)
+
+    def load(self, positions: List, orders: List[dict], as_of: Optional[pandas.Timestamp] = None) -> None:
+        """
+            Seeds the state from a REST snapshot requested at `as_of`, then replays the updates buffered since the
+            subscription that are newer than the snapshot
+        """
+        with self.changed:
+            self.positions = {}
+            for position in positions:
+                qty = abs(float(position.qty)) * (-1 if position.side == "short" else 1)
+                self.positions[position.symbol] = LocalPosition(position.symbol, qty, float(position.avg_entry_price),
+                                                                float(position.current_price))
+            self.open_orders = {order["id"]: order for order in orders}
+            self.filled_qty = {leg["id"]: float(leg.get("filled_qty") or 0)
+                               for order in orders for leg in [order] + (order.get("legs") or [])}
+            buffered, self.buffered = self.buffered, []
+            self.synced = True
+            self.changed.notify_all()
+
+        for update in buffered:
+            if as_of is None or update[-1] > as_of:
+                self.on_trade_update(*update)
+
+    def on_trade_update(self, event: str, order: dict, price: Optional[float], qty: Optional[float],
+                        timestamp: pandas.Timestamp) -> None:
+        """ `qty` is the quantity filled so far on the order, the fill is what it adds to the previous update """
+        with self.changed:
+            if not self.synced:
+                self.buffered.append((event, order, price, qty, timestamp))
+                return
+
+            fill = None
+            if event in ("fill", "partial_fill") and price is not None and qty:
+                filled = qty - self.filled_qty.get(order["id"], 0.0)
+                if filled > 0:
+                    fill = Fill(order["id"], order["symbol"], order["side"], filled, price, timestamp)
+                    self.fills.append(fill)
+                    self._apply(fill)
+                    self.filled_qty[order["id"]] = qty
+
+            if event in OPEN_EVENTS:
+                self.open_orders[order["id"]] = order
+            elif event in DONE_EVENTS:
+                self.open_orders.pop(order["id"], None)
+            self.changed.notify_all()
+
+        if fill is not None:
+            for handler in self.fill_handlers:
+                handler(fill)
+
+    def get_positions(self) -> List[LocalPosition]:
+        with self.changed:
+            positions = list(self.positions.values())
+        for position in positions:
+            price = self.price_feed.get_price(position.symbol) if self.price_feed else None
+            if price is not None:
+                position.current_price = price
+        return positions
+
+    def get_open_orders(self) -> List[dict]:
+        with self.changed:
+            return list(self.open_orders.values())
+
+    def wait_until_flat(self, timeout: float, symbols: Optional[List[str]] = None) -> bool:
+        """ Waits for fill events to close every position (of `symbols` when given), returns False on timeout """
+        if symbols is None:
+            return self._wait_for(lambda: not self.positions, timeout)
+        return self._wait_for(lambda: not any(symbol in self.positions for symbol in symbols), timeout)
+
+    def wait_until_no_open_orders(self, timeout: float, symbols: Optional[List[str]] = None) -> bool:
+        if symbols is None:
+            return self._wait_for(lambda: not self.open_orders, timeout)
+        return self._wait_for(lambda: not any(order["symbol"] in symbols for order in self.open_orders.values()),
+                              timeout)
+
+    def _wait_for(self, predicate, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self.changed:
+            while not predicate():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+            return True
+
+    def _apply(self, fill: Fill) -> None:
+        signed_qty = fill.qty if fill.side == "buy" else -fill.qty
+        position = self.positions.get(fill.symbol)
+        if position is None:
+            self.positions[fill.symbol] = LocalPosition(fill.symbol, signed_qty, fill.price, fill.price)
+            return
+
+        new_qty = position.qty + signed_qty
+        if new_qty == 0:
+            del self.positions[fill.symbol]
+            return
+
+        if position.qty * signed_qty > 0:
+            # adding to the position
+            position.avg_entry_price = (position.avg_entry_price * position.qty + fill.price * signed_qty) / new_qty
+        elif position.qty * new_qty < 0:
+            # flipped from long to short or vice versa
+            position.avg_entry_price = fill.price
+        position.qty = new_qty
+        position.current_price = fill.price
@@ -0,0 +1,180 @@
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional
+
+import numpy
+import pandas
+
+from utils.bar_store import TIMEZONE
+from utils.broker import BAR_FIELDS, Broker, Timeframe
+from utils.market_stream import PriceFeed, TradeStream
+from utils.portfolio_state import LocalPosition, PortfolioState
+
+FREQUENCY = {
+    Timeframe.MIN_1: "1min",
+    Timeframe.MIN_5: "5min",
+    Timeframe.MIN_15: "15min",
+    Timeframe.DAY: "B",
+}
+
+
+@dataclass
+class SimulatedOrder:
+    id: str
+    symbol: str
+    side: str
+    qty: int
+    stop_loss: float
+    take_profit: float
+    price: float
+    status: str = "filled"
+
+
+@dataclass
+class SimulatedAccount:
+    portfolio_value: float
+    cash: float
+
+
+class SimulatedBroker(Broker):
+    """
+        In-memory broker for benchmarks and offline runs: synthetic random walk bars for `n_symbols` symbols, every
+        call delayed by `latency` seconds like a round trip to the broker, and market orders filled at the current
+        price and recorded in `orders`. The market is always open. Streamed prices come from `trade_stream`, e.g. a
+        ReplayTradeStream of recorded trades.
+    """
+
+    def __init__(self, n_symbols: int, history: int = 300, latency: float = 0.0, volatility: float = 0.04,
+                 seed: int = 42, initial_equity: float = 100000, trade_stream: Optional[TradeStream] = None):
+        self.latency = latency
+        self.volatility = volatility
+        self.initial_equity = initial_equity
+        self.rng = numpy.random.default_rng(seed)
+        self.symbols = ["S{:04d}".format(i) for i in range(n_symbols)]
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.bars = self._random_walk(n_symbols, history)
+        self.price_feed = PriceFeed()
+        self.trade_stream = trade_stream
+
+        self.lock = threading.Lock()
+        self.order_ids = itertools.count(1)
+        self.orders: List[SimulatedOrder] = []
+        self.positions: Dict[str, LocalPosition] = {}
+
+    def get_portfolio(self) -> SimulatedAccount:
+        self._wait()
+        with self.lock:
+            invested = sum(position.market_value for position in self.positions.values())
+            pnl = sum(position.unrealized_pl for position in self.positions.values())
+        return SimulatedAccount(self.initial_equity + pnl, self.initial_equity + pnl - invested)
+
+    def sync_portfolio(self) -> PortfolioState:
+        # a snapshot of the simulated positions, the simulator sends no trade updates
+        portfolio_state = PortfolioState(self.price_feed)
+        portfolio_state.load(self.get_positions(), [])
+        return portfolio_state
+
+    def get_current_price(self, symbol) -> float:
+        self._wait()
+        last_close = self.bars[self.index[symbol], -1, BAR_FIELDS.index("close")]
+        return float(last_close * (1 + self.rng.normal(0, self.volatility)))
+
+    def stream_prices(self, symbols: List[str]) -> PriceFeed:
+        if self.trade_stream is not None:
+            self.trade_stream.subscribe(symbols, self.price_feed.on_trade)
+        return self.price_feed
+
+    def get_bars(self, symbol: str, timeframe: Timeframe, limit: int) -> pandas.DataFrame:
+        return self.get_bars_many([symbol], timeframe, limit).loc[symbol]
+
+    def get_bars_many(self, symbols: List[str], timeframe: Timeframe, limit: int) -> pandas.DataFrame:
+        self._wait()
+        limit = min(limit, self.bars.shape[1])
+        return self._panel(symbols, self._times(timeframe)[-limit:], slice(-limit, None))
+
+    def get_bars_range(self, symbols: List[str], timeframe: Timeframe, start: pandas.Timestamp,
+                       end: pandas.Timestamp, limit: int) -> pandas.DataFrame:
+        self._wait()
+        times = self._times(timeframe)
+        first, last = times.searchsorted(pandas.Timestamp(start)), times.searchsorted(pandas.Timestamp(end), "right")
+        first = max(first, last - limit)
+        return self._panel(symbols, times[first:last], slice(first, last))
+
+    def get_positions(self) -> List[LocalPosition]:
+        self._wait()
+        with self.lock:
+            return list(self.positions.values())
+
+    def await_market_open(self):
+        pass
+
+    def await_market_close(self):
+        pass
+
+    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit, check_market_open=True):
+        price = self.get_current_price(symbol)
+        with self.lock:
+            order = SimulatedOrder(str(next(self.order_ids)), symbol, side, qty, stop_loss, take_profit, price)
+            self.orders.append(order)
+            signed_qty = qty if side == "buy" else -qty
+            self.positions[symbol] = LocalPosition(symbol, signed_qty, price, price)
+        return order
+
+    def cancel_open_orders(self, symbols: Optional[List[str]] = None):
+        self._wait()
+
+    def close_all_positions(self, symbols: Optional[List[str]] = None):
+        self._wait()
+        with self.lock:
+            self.positions = {symbol: position for symbol, position in self.positions.items()
+                              if symbols is not None and symbol not in symbols}
+
+    def is_tradable(self, symbol: str) -> bool:
+        return symbol in self.index
+
+    def filter_tradable(self, symbols: List[str]) -> List[str]:
+        return [symbol for symbol in symbols if symbol in self.index]
+
+    def is_market_open(self) -> bool:
+        return True
+
+    def is_trading_day(self) -> bool:
+        return True
+
+    def next_trading_day(self, after: Optional[date] = None) -> date:
+        after = after or pandas.Timestamp.now(tz=TIMEZONE).date()
+        return numpy.busday_offset(after, 1, roll="forward").astype(date)
+
+    def reset_orders(self) -> None:
+        with self.lock:
+            self.orders = []
+            self.positions = {}
+
+    def _random_walk(self, n_symbols: int, history: int) -> numpy.ndarray:
+        # (symbols, bars, open/high/low/close/volume) with prices mostly inside the LW price band
+        start = self.rng.uniform(15, 600, size=(n_symbols, 1))
+        close = start * numpy.exp(numpy.cumsum(self.rng.normal(0, self.volatility, (n_symbols, history)), axis=1))
+        open_ = numpy.concatenate([start, close[:, :-1]], axis=1) * (1 + self.rng.normal(0, 0.005, close.shape))
+        spread = numpy.abs(self.rng.normal(0, self.volatility / 2, close.shape))
+        high = numpy.maximum(open_, close) * (1 + spread)
+        low = numpy.minimum(open_, close) * (1 - spread)
+        volume = self.rng.integers(10000, 10000000, close.shape).astype(float)
+        return numpy.stack([open_, high, low, close, volume], axis=-1)
+
+    def _times(self, timeframe: Timeframe) -> pandas.DatetimeIndex:
+        # the synthetic history ends today
+        return pandas.date_range(end=pandas.Timestamp.now(tz=TIMEZONE).normalize(), periods=self.bars.shape[1],
+                                 freq=FREQUENCY[timeframe])
+
+    def _panel(self, symbols: List[str], times: pandas.DatetimeIndex, bars: slice) -> pandas.DataFrame:
+        symbols = sorted(symbol for symbol in set(symbols) if symbol in self.index)
+        values = self.bars[[self.index[symbol] for symbol in symbols], bars].reshape(-1, len(BAR_FIELDS))
+        index = pandas.MultiIndex.from_product([symbols, times], names=["symbol", "time"])
+        return pandas.DataFrame(values, index=index, columns=BAR_FIELDS)
+
+    def _wait(self) -> None:
+        if self.latency > 0:
+            time.sleep(self.latency)
@@ -0,0 +1,54 @@
+import dataclasses
+import os
+from datetime import date
+from pathlib import Path
+from typing import List, Optional, Type
+
+import numpy
+
+
+class StateStore(object):
+    """
+        Day snapshots of a strategy's state as small .npy files (<folder>/<day>.<name>.npy): lists of flat dataclasses
+        as structured arrays and symbol lists as string arrays. Writes are atomic, so a crash leaves the previous
+        snapshot intact, and loading one takes well under a millisecond.
+    """
+    SYMBOL_DTYPE = "U16"
+
+    def __init__(self, folder: Path):
+        self.folder = folder
+
+    def save_records(self, name: str, day: date, records: List, record_type: Type) -> None:
+        fields = dataclasses.fields(record_type)
+        dtype = numpy.dtype([(field.name, StateStore.SYMBOL_DTYPE if field.type in (str, "str") else "<f8")
+                             for field in fields])
+        array = numpy.array([tuple(getattr(record, field.name) for field in fields) for record in records], dtype=dtype)
+        self._write(name, day, array)
+
+    def load_records(self, name: str, day: date, record_type: Type) -> Optional[List]:
+        array = self._read(name, day)
+        if array is None:
+            return None
+        return [record_type(**{field: row[field].item() for field in array.dtype.names}) for row in array]
+
+    def save_symbols(self, name: str, day: date, symbols: List[str]) -> None:
+        self._write(name, day, numpy.array(symbols, dtype=StateStore.SYMBOL_DTYPE))
+
+    def load_symbols(self, name: str, day: date) -> Optional[List[str]]:
+        array = self._read(name, day)
+        return None if array is None else array.tolist()
+
+    def _write(self, name: str, day: date, array: numpy.ndarray) -> None:
+        path = self._path(name, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            numpy.save(f, array)
+        os.replace(tmp_path, path)
+
+    def _read(self, name: str, day: date) -> Optional[numpy.ndarray]:
+        path = self._path(name, day)
+        return numpy.load(path) if path.exists() else None
+
+    def _path(self, name: str, day: date) -> Path:
+        return self.folder / "{}.{}.npy".format(day.isoformat(), name)
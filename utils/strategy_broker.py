@@ -0,0 +1,140 @@
+import threading
+from datetime import date
+from typing import Dict, List, Optional
+
+from utils.broker import Broker, Timeframe
+from utils.market_data import MarketData
+
+
+class Ownership(object):
+    """ Which strategy holds each symbol. The broker nets positions per symbol, so a symbol has one owner a day """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners: Dict[str, str] = {}
+
+    def claim(self, symbol: str, strategy: str) -> bool:
+        with self.lock:
+            return self.owners.setdefault(symbol, strategy) == strategy
+
+    def release(self, symbols: List[str], strategy: str) -> None:
+        with self.lock:
+            for symbol in symbols:
+                if self.owners.get(symbol) == strategy:
+                    del self.owners[symbol]
+
+    def owned_by(self, strategy: str) -> List[str]:
+        with self.lock:
+            return [symbol for symbol, owner in self.owners.items() if owner == strategy]
+
+
+class StrategyBroker(Broker):
+    """
+        The broker as one strategy of a multi strategy run sees it: market data comes from the shared cache, positions
+        and orders are limited to the symbols the strategy owns, and new orders are refused once the notional of its
+        orders would exceed its budget.
+    """
+
+    def __init__(self, broker: Broker, market_data: MarketData, strategy: str, ownership: Ownership,
+                 budget: Optional[float] = None):
+        self.broker = broker
+        self.market_data = market_data
+        self.strategy = strategy
+        self.ownership = ownership
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.committed: Dict[str, float] = {}  # symbol -> notional of the orders placed today
+
+    def get_portfolio(self):
+        return self.broker.get_portfolio()
+
+    def sync_portfolio(self):
+        return self.broker.sync_portfolio()
+
+    def get_current_price(self, symbol) -> float:
+        return self.market_data.get_current_price(symbol)
+
+    def stream_prices(self, symbols: List[str]):
+        return self.market_data.stream_prices(symbols)
+
+    def get_bars(self, symbol: str, timeframe: Timeframe, limit: int):
+        return self.broker.get_bars(symbol, timeframe, limit)
+
+    def get_bars_many(self, symbols: List[str], timeframe: Timeframe, limit: int):
+        return self.broker.get_bars_many(symbols, timeframe, limit)
+
+    def get_bars_range(self, symbols: List[str], timeframe: Timeframe, start, end, limit: int):
+        return self.broker.get_bars_range(symbols, timeframe, start, end, limit)
+
+    def get_positions(self) -> List:
+        owned = set(self.ownership.owned_by(self.strategy))
+        return [position for position in self.broker.get_positions() if position.symbol in owned]
+
+    def await_market_open(self):
+        self.broker.await_market_open()
+
+    def await_market_close(self):
+        self.broker.await_market_close()
+
+    def place_bracket_order(self, symbol, side, qty, stop_loss, take_profit, check_market_open=True):
+        notional = qty * self.get_current_price(symbol)
+        with self.lock:
+            if not self.ownership.claim(symbol, self.strategy):
+                print("{}: {} is traded by another strategy, order not placed".format(self.strategy, symbol))
+                return None
+            if self.budget is not None and sum(self.committed.values()) + notional > self.budget:
+                print("{}: budget of ${} used up, order for {} not placed".format(self.strategy, self.budget, symbol))
+                self.ownership.release([symbol], self.strategy)
+                return None
+            self.committed[symbol] = notional
+
+        order = self.broker.place_bracket_order(symbol, side, qty, stop_loss, take_profit, check_market_open)
+        if order is None:
+            with self.lock:
+                del self.committed[symbol]
+                self.ownership.release([symbol], self.strategy)
+        return order
+
+    def restore(self, symbols: List[str]) -> None:
+        """ After a restart: claims the symbols traded before it and commits the notional of their open positions """
+        positions = {position.symbol: position for position in self.broker.get_positions()}
+        with self.lock:
+            for symbol in symbols:
+                if not self.ownership.claim(symbol, self.strategy):
+                    continue
+                position = positions.get(symbol)
+                if position is not None:
+                    self.committed[symbol] = abs(float(position.qty) * float(position.avg_entry_price))
+
+    def cancel_open_orders(self, symbols: Optional[List[str]] = None):
+        owned = self._owned(symbols)
+        if owned:
+            self.broker.cancel_open_orders(owned)
+
+    def close_all_positions(self, symbols: Optional[List[str]] = None):
+        owned = self._owned(symbols)
+        if owned:
+            self.broker.close_all_positions(owned)
+        with self.lock:
+            for symbol in owned:
+                self.committed.pop(symbol, None)
+            self.ownership.release(owned, self.strategy)
+
+    def is_tradable(self, symbol: str) -> bool:
+        return self.broker.is_tradable(symbol)
+
+    def filter_tradable(self, symbols: List[str]) -> List[str]:
+        return self.broker.filter_tradable(symbols)
+
+    def is_market_open(self) -> bool:
+        return self.broker.is_market_open()
+
+    def is_trading_day(self) -> bool:
+        return self.broker.is_trading_day()
+
+    def next_trading_day(self, after: Optional[date] = None) -> date:
+        return self.broker.next_trading_day(after)
+
+    def _owned(self, symbols: Optional[List[str]]) -> List[str]:
+        owned = self.ownership.owned_by(self.strategy)
+        return owned if symbols is None else [symbol for symbol in owned if symbol in symbols]
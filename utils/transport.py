@@ -0,0 +1,171 @@
+import functools
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+SYMBOL_SEGMENT = re.compile(r"/[A-Z][A-Z.]{0,9}(?=/|$)")
+
+
+@dataclass
+class EndpointStats:
+    calls: int = 0
+    errors: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+class InstrumentedSession(requests.Session):
+    """ Session applying the transport timeouts and recording the latency and errors of every request """
+
+    def __init__(self, transport: "Transport", name: str):
+        super().__init__()
+        self.transport = transport
+        self.name = name
+        adapter = HTTPAdapter(pool_connections=transport.pool_size, pool_maxsize=transport.pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", self.transport.timeout)
+        # symbols in paths are folded, so that e.g. every last trade lookup is one endpoint
+        endpoint = "{} {} {}".format(self.name, method.upper(), SYMBOL_SEGMENT.sub("/{symbol}", urlparse(url).path))
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.RequestException:
+            self.transport.record(endpoint, time.perf_counter() - start, error=True)
+            raise
+        self.transport.record(endpoint, time.perf_counter() - start, error=response.status_code >= 400)
+        return response
+
+
+class InstrumentedClient(object):
+    """
+        Wraps the client of an API with its own session, e.g. the Alpaca REST client: every method call is recorded
+        in the transport's per endpoint latency/error counters, the client keeps its connections and retries.
+    """
+
+    def __init__(self, transport: "Transport", name: str, client):
+        self.transport = transport
+        self.name = name
+        self.client = client
+
+    def __getattr__(self, attribute):
+        value = getattr(self.client, attribute)
+        if not callable(value) or attribute.startswith("_"):
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            endpoint = "{} {}".format(self.name, attribute)
+            start = time.perf_counter()
+            try:
+                result = value(*args, **kwargs)
+            except Exception:
+                self.transport.record(endpoint, time.perf_counter() - start, error=True)
+                raise
+            self.transport.record(endpoint, time.perf_counter() - start, error=False)
+            return result
+        return call
+
+
+class Transport(object):
+    """
+        Outbound HTTP shared by the watchlist and the notifier: one keep-alive connection pool per client, explicit
+        connect/read timeouts, iterative retries with jittered exponential backoff and per endpoint latency/error
+        counters, which also count the broker's REST calls. Requests that aren't idempotent (e.g. a POST notification)
+        are only retried when the server can't have seen them: the connection failed or the request was rate limited.
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+    _shared: Optional["Transport"] = None
+
+    def __init__(self, pool_size: int = 20, connect_timeout: float = 3.05, read_timeout: float = 15,
+                 max_attempts: int = 3, backoff: float = 1.0):
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, InstrumentedSession] = {}
+        self.stats: Dict[str, EndpointStats] = {}
+
+    @classmethod
+    def shared(cls) -> "Transport":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def session(self, name: str) -> InstrumentedSession:
+        with self.lock:
+            if name not in self.sessions:
+                self.sessions[name] = InstrumentedSession(self, name)
+            return self.sessions[name]
+
+    def wrap(self, name: str, client) -> InstrumentedClient:
+        return InstrumentedClient(self, name, client)
+
+    def request(self, name: str, method: str, url: str, max_attempts: Optional[int] = None,
+                **kwargs) -> requests.Response:
+        """ Sends a request on the `name` session, retrying connection errors and retryable status codes """
+        max_attempts = max_attempts or self.max_attempts
+        idempotent = method.upper() in Transport.IDEMPOTENT_METHODS
+        retry_status = Transport.RETRY_STATUS if idempotent else {429}
+        session = self.session(name)
+        for attempt in range(1, max_attempts + 1):
+            try:
+                response = session.request(method, url, **kwargs)
+                if response.status_code not in retry_status or attempt == max_attempts:
+                    response.raise_for_status()
+                    return response
+                print("{} {} returned {}, retrying ({}/{})".format(method, url, response.status_code, attempt,
+                                                                    max_attempts))
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                # e.g. a read timeout after the server accepted a POST, sending it again would duplicate it
+                if attempt == max_attempts or not (idempotent or Transport._not_sent(ex)):
+                    raise
+                print("{} {} failed: {}, retrying ({}/{})".format(method, url, ex, attempt, max_attempts))
+            time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _not_sent(ex: requests.RequestException) -> bool:
+        # the connection was never established, so the server can't have received the request
+        if isinstance(ex, requests.ConnectTimeout):
+            return True
+        reason = getattr(ex.args[0], "reason", None) if ex.args else None
+        return isinstance(reason, NewConnectionError)
+
+    def get(self, name: str, url: str, **kwargs) -> requests.Response:
+        return self.request(name, "GET", url, **kwargs)
+
+    def post(self, name: str, url: str, **kwargs) -> requests.Response:
+        return self.request(name, "POST", url, **kwargs)
+
+    def record(self, endpoint: str, seconds: float, error: bool) -> None:
+        with self.lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+
+    def report(self) -> str:
+        with self.lock:
+            lines = ["{:<60} {:>6} {:>6} {:>9} {:>9}".format("endpoint", "calls", "errors", "mean ms", "max ms")]
+            for endpoint, stats in sorted(self.stats.items()):
+                lines.append("{:<60} {:>6} {:>6} {:>9.1f} {:>9.1f}".format(endpoint, stats.calls, stats.errors,
+                                                                          stats.mean_seconds * 1000,
+                                                                          stats.max_seconds * 1000))
+        return "\n".join(lines)
@@ -1,4 +1,5 @@
 import os
+from typing import Iterator, List, Sequence
 
 import yaml
 
@@ -11,9 +12,14 @@ def load_env_variables():
 
 
 def load_app_variables(input_key):
-    with open("conf/app.yaml") as f:
+    with open("conf/config.yml") as f:
         config = yaml.safe_load(f)
         for key, value in config.items():
             if input_key == key:
                 return value
         return None
+
+
+def chunked(items: Sequence, size: int) -> Iterator[List]:
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])